@@ -0,0 +1,95 @@
+"""Benchmark the flattening of the ParameterScale nodes of the real tree.
+
+Compares the per-bracket DataFrame construction previously done in `ui.py`
+with `scale.flatten_scale` on every scale of the Nouvelle-Calédonie tax
+benefit system, and checks that both produce the same table.
+
+Usage:
+    uv run python benchmarks/bench_scale.py [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "app"))
+
+from openfisca_core.parameters import ParameterScale  # noqa: E402
+from openfisca_nouvelle_caledonie import CountryTaxBenefitSystem  # noqa: E402
+
+from scale import flatten_scale  # noqa: E402
+
+
+def legacy_flatten_scale(node):
+    """Former implementation: one DataFrame per bracket, cell by cell."""
+    scale_df = pd.DataFrame()
+    for rank, bracket in enumerate(node.brackets):
+        bracket_df = pd.DataFrame()
+        for key in ['threshold', 'rate', 'amount']:
+            child = bracket.children.get(key)
+            if child is None:
+                continue
+            for param_at_instant in getattr(child, "values_list", []):
+                bracket_df.at[param_at_instant.instant_str, key] = str(param_at_instant.value)
+        if not bracket_df.empty:
+            scale_df = pd.concat([scale_df, pd.concat([bracket_df], keys=[rank], axis=1)], axis=1)
+
+    if scale_df.empty:
+        return scale_df
+
+    scale_df = scale_df.sort_index()
+    for col in scale_df.columns:
+        first_valid = scale_df[col].first_valid_index()
+        if first_valid is not None:
+            scale_df.loc[first_valid:, col] = scale_df.loc[first_valid:, col].ffill()
+    return scale_df.sort_index(ascending=False)
+
+
+def collect_scales(node, scales):
+    if isinstance(node, ParameterScale):
+        scales.append(node)
+    elif hasattr(node, "children"):
+        for child in node.children.values():
+            collect_scales(child, scales)
+    return scales
+
+
+def best_time(function, scales, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for scale in scales:
+            function(scale)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    scales = collect_scales(CountryTaxBenefitSystem().parameters, [])
+    brackets = sum(len(scale.brackets) for scale in scales)
+
+    for scale in scales:
+        expected = legacy_flatten_scale(scale)
+        result = flatten_scale(scale)
+        pd.testing.assert_frame_equal(
+            expected.astype(object), result.astype(object),
+            check_names=False, check_column_type=False, check_index_type=False
+        )
+
+    legacy = best_time(legacy_flatten_scale, scales, args.repeat)
+    vectorized = best_time(flatten_scale, scales, args.repeat)
+    print(f"{len(scales)} scales, {brackets} brackets")
+    print(f"legacy:     {legacy * 1000:8.1f} ms")
+    print(f"vectorized: {vectorized * 1000:8.1f} ms")
+    print(f"speedup:    {legacy / vectorized:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
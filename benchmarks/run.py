@@ -0,0 +1,219 @@
+"""Benchmark suite for the hot paths of the app.
+
+Times, on a synthetic parameter tree of configurable size (no survey data
+needed):
+
+- building the parameter index and the parameter UI (eager and lazy),
+- `SimpleParameterTracker.update_value` and `get_changed_by_path`,
+- `build_reform_code`, the former temp-module import path of
+  `execute_code` and the in-memory `build_reform_from_changes`,
+- `ScenarioAnalysis.aggregates`, the pivot tables and the encoded Results
+  figures on synthetic results.
+
+Results are written as JSON and can be compared with a previous run to
+flag regressions.
+
+Usage:
+    uv run python benchmarks/run.py --output bench.json
+    uv run python benchmarks/run.py --breadth 8 --compare bench.json --threshold 0.2
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "app"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from figures import encode_figure  # noqa: E402
+from parameter import ParameterIndex, SimpleParameterTracker  # noqa: E402
+from reform import build_reform_code, build_reform_from_changes  # noqa: E402
+from results import PIVOT_AGGFUNCS, PIVOT_VARIABLES  # noqa: E402
+from scenario import ScenarioAnalysis  # noqa: E402
+from search import SearchIndex  # noqa: E402
+from ui import build_lazy_param_ui, build_param_ui  # noqa: E402
+from worker import SimulationPool  # noqa: E402
+
+from synthetic import synthetic_parameters, synthetic_results  # noqa: E402
+
+
+def measure(function, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {"median_s": statistics.median(timings), "min_s": min(timings), "repeat": repeat}
+
+
+def import_temp_module(code: str):
+    """Former execute_code path: write the generated code and import it"""
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "temp_module.py")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(code)
+        spec = importlib.util.spec_from_file_location("temp_module", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module.CustomReform
+
+
+class _FinishedTask:
+    """Stands for the simulation task of a session once its results are in"""
+
+    def __init__(self, results):
+        self._results = results
+
+    def result(self):
+        return self._results
+
+
+def run_suite(args) -> dict:
+    root = synthetic_parameters(depth=args.depth, breadth=args.breadth, leaves=args.leaves,
+                                values=args.values, brackets=args.brackets)
+    index = ParameterIndex.from_parameters(root)
+    field_ids = list(index.fields)
+    rng = random.Random(0)
+    edited = rng.sample(field_ids, min(args.edits, len(field_ids)))
+
+    tracker = SimpleParameterTracker(index)
+    tracker.track(field_ids)
+    for field_id in edited:
+        tracker.update_value(field_id, "0.5")
+    changes = tracker.get_changed_values_only()
+    code = build_reform_code(tracker, args.period)
+
+    def update_values():
+        session_tracker = SimpleParameterTracker(index)
+        session_tracker.track(field_ids)
+        for field_id in edited:
+            session_tracker.update_value(field_id, "0.5")
+            session_tracker.update_value(field_id, index[field_id].initial)
+
+    search_index = SearchIndex.from_index(index)
+    queries = [" ".join(path.split(".")[-2:])[:6] for path in rng.sample(list(index.leaves), 20)]
+
+    def search_queries():
+        for query in queries:
+            search_index.search(query)
+
+    results = synthetic_results(households=args.households)
+
+    def aggregates():
+        analysis = ScenarioAnalysis(None, args.period, pool=SimulationPool())
+        analysis.simulate = _FinishedTask(results)
+        analysis.aggregates()
+
+    def figures() -> int:
+        # Cold pass: the encoded figures are otherwise kept in `figure_cache`
+        analysis = ScenarioAnalysis(None, args.period, pool=SimulationPool())
+        analysis.simulate = _FinishedTask(results)
+        payloads = [encode_figure(analysis.render_aggregates_plot(measure)) for measure in ("amount", "beneficiaries")]
+        payloads.extend(
+            encode_figure(analysis.render_scenario_pivot_plot(variable, "sum")) for variable in PIVOT_VARIABLES
+        )
+        return sum(nbytes for _, nbytes in payloads)
+
+    def pivot_tables():
+        # Cold pass: the pivots are otherwise kept with the results
+        results._pivots.clear()
+        for variable in PIVOT_VARIABLES:
+            for aggfunc in PIVOT_AGGFUNCS:
+                results.pivot_table(variable, aggfunc)
+
+    def render_html(elements) -> str:
+        return "".join(str(element) for element in elements)
+
+    eager_bytes = len(render_html(build_param_ui(index)))
+    lazy_bytes = len(render_html(build_lazy_param_ui(index)))
+
+    suite = {
+        "parameter_index": measure(lambda: ParameterIndex.from_parameters(root), args.repeat),
+        "build_param_ui_eager": dict(measure(lambda: render_html(build_param_ui(index)), args.repeat), bytes=eager_bytes),
+        "build_param_ui_lazy": dict(measure(lambda: render_html(build_lazy_param_ui(index)), args.repeat), bytes=lazy_bytes),
+        "search_index": measure(lambda: SearchIndex.from_index(index), args.repeat),
+        "search_queries": measure(search_queries, args.repeat),
+        "tracker_update_value": measure(update_values, args.repeat),
+        "tracker_get_changed_by_path": measure(tracker.get_changed_by_path, args.repeat),
+        "build_reform_code": measure(lambda: build_reform_code(tracker, args.period), args.repeat),
+        "execute_temp_module": measure(lambda: import_temp_module(code), args.repeat),
+        "build_reform_in_memory": measure(lambda: build_reform_from_changes(changes, args.period), args.repeat),
+        "scenario_aggregates": measure(aggregates, args.repeat),
+        "pivot_tables": measure(pivot_tables, args.repeat),
+        "scenario_figures": dict(measure(figures, args.repeat), bytes=figures()),
+    }
+    return {"fields": len(field_ids), "edits": len(edited), "households": args.households, "cases": suite}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Cases whose median time grew by more than `threshold` (relative)"""
+    regressions = []
+    for case, timing in current["cases"].items():
+        reference = baseline["cases"].get(case)
+        if reference is None:
+            continue
+        ratio = timing["median_s"] / reference["median_s"] if reference["median_s"] else float("inf")
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{case:32s} {reference['median_s'] * 1000:10.2f} ms -> {timing['median_s'] * 1000:10.2f} ms  x{ratio:5.2f} {flag}")
+        if flag:
+            regressions.append(case)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks des chemins critiques de l'application")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--breadth", type=int, default=6)
+    parser.add_argument("--leaves", type=int, default=8)
+    parser.add_argument("--values", type=int, default=3)
+    parser.add_argument("--brackets", type=int, default=5)
+    parser.add_argument("--edits", type=int, default=50)
+    parser.add_argument("--households", type=int, default=100_000)
+    parser.add_argument("--period", type=int, default=2023)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None, help="Fichier JSON où écrire les résultats")
+    parser.add_argument("--compare", default=None, help="Résultats JSON de référence")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Hausse relative tolérée")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "arguments": vars(args),
+        },
+        **run_suite(args),
+    }
+
+    for case, timing in report["cases"].items():
+        print(f"{case:32s} {timing['median_s'] * 1000:10.2f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
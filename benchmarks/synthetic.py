@@ -0,0 +1,78 @@
+"""Synthetic parameter trees and results for the benchmarks.
+
+They mimic the shape of the Nouvelle-Calédonie tree (nested nodes, simple
+parameters with several dated values, scales with several brackets) at a
+configurable size, so the benchmarks run without the survey data.
+"""
+
+import numpy as np
+import pandas as pd
+from openfisca_core.parameters import ParameterNode
+
+from results import AGGREGATES_VARIABLES, PIVOT_GROUP_VARIABLE, PIVOT_VARIABLES, WEIGHTS, ReformResults
+
+INSTANTS = ("2019-01-01", "2020-01-01", "2021-01-01", "2022-01-01", "2023-01-01")
+
+
+def _leaf(rank: int, values: int) -> dict:
+    return {
+        "description": f"Paramètre {rank}",
+        "values": {instant: {"value": round(0.01 * (rank + position), 4)} for position, instant in enumerate(INSTANTS[:values])},
+    }
+
+
+def _scale(rank: int, brackets: int, values: int) -> dict:
+    return {
+        "description": f"Barème {rank}",
+        "brackets": [
+            {
+                "threshold": {instant: {"value": 1000 * bracket} for instant in INSTANTS[:values]},
+                "rate": {instant: {"value": round(0.05 * bracket + 0.001 * position, 4)} for position, instant in enumerate(INSTANTS[:values])},
+            }
+            for bracket in range(brackets)
+        ],
+    }
+
+
+def synthetic_tree_data(depth: int = 3, breadth: int = 6, leaves: int = 8, values: int = 3,
+                        scale_every: int = 4, brackets: int = 5) -> dict:
+    """Nested parameter data: `breadth` children per node, `leaves` parameters per deepest node"""
+    counter = iter(range(10 ** 9))
+
+    def node(level: int) -> dict:
+        if level == depth:
+            data = {}
+            for position in range(leaves):
+                rank = next(counter)
+                data[f"p{rank}"] = _scale(rank, brackets, values) if position % scale_every == scale_every - 1 else _leaf(rank, values)
+            return data
+        return {f"n{level}_{position}": node(level + 1) for position in range(breadth)}
+
+    return node(0)
+
+
+def synthetic_parameters(**size) -> ParameterNode:
+    return ParameterNode("", data=synthetic_tree_data(**size))
+
+
+def synthetic_results(households: int = 100_000, reform: bool = True, seed: int = 0) -> ReformResults:
+    """Results with random arrays for `households` foyers"""
+    rng = np.random.default_rng(seed)
+    parts = rng.choice([1, 1.5, 2, 2.5, 3, 3.5, 4], size=households)
+    weights = rng.uniform(0.5, 2, size=households)
+    arrays = {}
+    for simulation in ("baseline", "reform") if reform else ("baseline",):
+        arrays[simulation] = {variable: rng.gamma(2, 1000, size=households) for variable in PIVOT_VARIABLES}
+        arrays[simulation][PIVOT_GROUP_VARIABLE] = parts
+        arrays[simulation][WEIGHTS] = weights
+
+    columns = {"label": list(AGGREGATES_VARIABLES), "entity": ["foyer_fiscal"] * len(AGGREGATES_VARIABLES)}
+    for simulation in ("baseline", "reform"):
+        for measure in ("amount", "beneficiaries"):
+            columns[f"{simulation}_{measure}"] = rng.random(len(AGGREGATES_VARIABLES)) * 1e6
+    for measure in ("amount", "beneficiaries"):
+        columns[f"absolute_difference_{measure}"] = columns[f"reform_{measure}"] - columns[f"baseline_{measure}"]
+        columns[f"relative_difference_{measure}"] = columns[f"absolute_difference_{measure}"] / columns[f"baseline_{measure}"]
+    aggregates = pd.DataFrame(columns, index=list(AGGREGATES_VARIABLES))
+
+    return ReformResults(2023, "synthetic", aggregates, {}, arrays)
@@ -1,30 +1,112 @@
-from shiny import App
+import contextlib
+import os
+import time
 
-from openfisca_nouvelle_caledonie import CountryTaxBenefitSystem
+startup_start = time.perf_counter()
 
+from shiny import App
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Mount, Route
 
-from parameter import SimpleParameterTracker
-from ui import app_ui
+from cache import ScenarioCache
+from metrics import process_metrics, render_metrics
+from parameter import ParameterIndex, SimpleParameterTracker
+from ui import STATIC_ASSETS, app_ui
+from search import SearchIndex
 from server import server_logic
-
-param_tracker = SimpleParameterTracker()
+from snapshot import load_snapshot, save_snapshot, snapshot_key
+from store import ResultStore
+from worker import SimulationPool
 
 # Configuration
 period = 2023
+# Construire les panneaux de paramètres à leur première ouverture
+lazy_ui = True
+# Budget mémoire du cache des simulations partagé entre sessions
+cache_max_bytes = int(os.environ.get("REFORM_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+# Cache disque des résultats (répertoire et taille maximale)
+result_store_dir = os.environ.get("REFORM_RESULT_STORE", ".reform_cache")
+result_store_max_bytes = int(os.environ.get("REFORM_RESULT_STORE_MAX_BYTES", 10 * 1024 ** 3))
+# Nombre de processus de simulation (par défaut, un par cœur)
+simulation_workers = int(os.environ.get("REFORM_SIMULATION_WORKERS", os.cpu_count() or 1))
+# Nombre de situations de référence gardées par processus, en plus de celle de `period` (projections)
+max_baseline_periods = int(os.environ.get("REFORM_MAX_BASELINE_PERIODS", 2))
+# Instantané de l'index des paramètres et de l'interface, par version du paquet pays
+snapshot_dir = os.environ.get("REFORM_SNAPSHOT_DIR", ".reform_snapshot")
+
+process_metrics.observe("startup.imports", time.perf_counter() - startup_start)
 
 # Initialisation
-tbs = CountryTaxBenefitSystem()
+# Le système socio-fiscal n'est chargé que si l'instantané manque : les simulations tournent dans les workers
+ui = None
+key = snapshot_key(lazy_ui, period)
+with process_metrics.timer("startup.snapshot_load"):
+    snapshot = load_snapshot(snapshot_dir, key) if key is not None else None
+
+if snapshot is not None:
+    # Index en lecture seule partagé par toutes les sessions
+    param_index, ui = snapshot
+else:
+    from openfisca_nouvelle_caledonie import CountryTaxBenefitSystem
 
+    with process_metrics.timer("startup.tax_benefit_system"):
+        tbs = CountryTaxBenefitSystem()
+    with process_metrics.timer("startup.parameter_index"):
+        param_index = ParameterIndex.from_parameters(tbs.parameters)
 
 # Interface utilisateur
-ui = app_ui(tbs, param_tracker)
+if ui is None:
+    with process_metrics.timer("ui.build_param_ui"):
+        ui = app_ui(param_index, lazy=lazy_ui, period=period)
+    if key is not None:
+        save_snapshot(snapshot_dir, key, param_index, ui)
+# Index de recherche des paramètres, partagé par toutes les sessions
+with process_metrics.timer("startup.search_index"):
+    search_index = SearchIndex.from_index(param_index)
+process_metrics.snapshot_memory()
+
+scenario_cache = ScenarioCache(max_bytes=cache_max_bytes)
+result_store = ResultStore(result_store_dir, max_bytes=result_store_max_bytes)
+simulation_pool = SimulationPool(
+    max_workers=simulation_workers,
+    cache=scenario_cache,
+    baseline_periods=(period,),
+    store=result_store,
+    max_baseline_periods=max_baseline_periods
+)
+
+process_metrics.observe("startup.total", time.perf_counter() - startup_start)
+for name, histogram in sorted(process_metrics.histograms.items()):
+    print(f"{name}: {histogram.sum * 1000:.0f} ms")
 
 # Serveur
 def server(input, output, session):
-    server_logic(input, output, session, param_tracker, tbs, period)
+    # Chaque session ne stocke que ses propres modifications
+    param_tracker = SimpleParameterTracker(param_index)
+    server_logic(input, output, session, param_tracker, period, lazy=lazy_ui, simulation_pool=simulation_pool,
+                 search_index=search_index)
+
+async def metrics_endpoint(request):
+    # Histogrammes en texte brut, pour un collecteur local
+    return PlainTextResponse(render_metrics())
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Les workers démarrent avec le serveur et non à l'import : avec `spawn`, ils réimportent
+    # le module principal, et un pool créé à l'import casserait au démarrage de chacun
+    # La situation de référence est simulée dès le démarrage
+    simulation_pool.warm_baseline(period)
+    yield
+    simulation_pool.shutdown()
 
 # Créer l'application
-app = App(ui, server)
+shiny_app = App(ui, server, static_assets=STATIC_ASSETS)
+app = Starlette(routes=[
+    Route("/metrics", metrics_endpoint),
+    Mount("/", app=shiny_app),
+], lifespan=lifespan)
 
 if __name__ == "__main__":
-    app.run()
+    import uvicorn
+    uvicorn.run(app)
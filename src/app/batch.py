@@ -0,0 +1,143 @@
+'''Batch Runner Module.
+
+This module evaluates many reform proposals without the Shiny app, e.g. for
+a nightly regression run. Each reform is either a generated `reform.py`
+file or a JSON change list (`{"path": value}`, or a list of
+`{"name": ..., "changes": {...}}`). Reforms run in parallel on worker
+processes sharing one baseline per worker, and their aggregates and pivot
+tables are written to CSV, Parquet or JSON.
+
+Usage:
+    uv run python src/app/batch.py reforms/*.py reforms/*.json --period 2023 \\
+        --output results --format csv --workers 8
+'''
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from reform import reform_fingerprint
+from results import PIVOT_AGGFUNCS, PIVOT_VARIABLES, ReformResults
+from store import ResultStore
+import simulation
+
+FORMATS = ("csv", "parquet", "json")
+
+
+def _timed_job(function, *args) -> Tuple[ReformResults, float]:
+    """Run a simulation job and measure its wall time in the worker"""
+    start = time.perf_counter()
+    results = function(*args)
+    return results, time.perf_counter() - start
+
+
+def load_specs(paths: List[str]) -> List[Tuple[str, str, object]]:
+    """Return (name, kind, payload) for each reform: kind is "file" or "changes"."""
+    specs = []
+    for path in paths:
+        base_name = os.path.splitext(os.path.basename(path))[0]
+        if path.endswith(".py"):
+            specs.append((base_name, "file", os.path.abspath(path)))
+            continue
+
+        with open(path, encoding="utf-8") as f:
+            content = json.load(f)
+        entries = content if isinstance(content, list) else [{"name": base_name, "changes": content}]
+        for position, entry in enumerate(entries):
+            name = entry.get("name") or f"{base_name}_{position}"
+            changes = {parameter: str(value) for parameter, value in entry["changes"].items()}
+            specs.append((name, "changes", changes))
+    return specs
+
+
+def write_frame(df: pd.DataFrame, path: str, output_format: str):
+    if output_format == "csv":
+        df.to_csv(f"{path}.csv")
+    elif output_format == "parquet":
+        df.to_parquet(f"{path}.parquet")
+    else:
+        df.reset_index().to_json(f"{path}.json", orient="records", force_ascii=False, indent=2)
+
+
+def write_results(results: ReformResults, directory: str, output_format: str):
+    os.makedirs(directory, exist_ok=True)
+    write_frame(results.labelled_aggregates(), os.path.join(directory, "aggregates"), output_format)
+    for variable in PIVOT_VARIABLES:
+        for aggfunc in PIVOT_AGGFUNCS:
+            write_frame(
+                results.pivot_table(variable, aggfunc),
+                os.path.join(directory, f"pivot_{variable}_{aggfunc}"),
+                output_format
+            )
+
+
+def run_batch(specs, period: int, output: str, output_format: str = "csv", workers: Optional[int] = None,
+              store: Optional[ResultStore] = None) -> pd.DataFrame:
+    """Evaluate the reforms and write their results; returns the timing report"""
+    report: Dict[str, dict] = {}
+    start = time.perf_counter()
+
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=simulation.warm_baseline,
+        initargs=((period,),)
+    )
+    with executor:
+        futures = {}
+        for name, kind, payload in specs:
+            if kind == "changes":
+                stored = store.load(reform_fingerprint(payload, period), period) if store is not None else None
+                if stored is not None:
+                    write_results(stored, os.path.join(output, name), output_format)
+                    report[name] = {"status": "cached", "wall_time_s": 0.0, "fingerprint": stored.fingerprint}
+                    continue
+                future = executor.submit(_timed_job, simulation.run_reform, payload, period)
+            else:
+                future = executor.submit(_timed_job, simulation.run_reform_file, payload, period)
+            futures[future] = name
+
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results, wall_time = future.result()
+            except Exception as e:
+                report[name] = {"status": f"error: {e}", "wall_time_s": None, "fingerprint": None}
+                print(f"❌ {name}: {e}")
+                continue
+
+            if store is not None:
+                store.save(results)
+            write_results(results, os.path.join(output, name), output_format)
+            report[name] = {"status": "ok", "wall_time_s": round(wall_time, 3), "fingerprint": results.fingerprint}
+            print(f"✅ {name}: {wall_time:.1f} s")
+
+    report_df = pd.DataFrame.from_dict(report, orient="index").rename_axis("reform").sort_index()
+    report_df.to_csv(os.path.join(output, "report.csv"))
+    print(f"{len(specs)} réforme(s) en {time.perf_counter() - start:.1f} s")
+    return report_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Évalue des réformes OpenFisca sans l'application Shiny")
+    parser.add_argument("specs", nargs="+", help="Fichiers reform.py ou listes de changements JSON")
+    parser.add_argument("--period", type=int, default=2023)
+    parser.add_argument("--output", default="batch_results")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--store", default=None, help="Cache disque des résultats à réutiliser")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    store = ResultStore(args.store) if args.store else None
+    run_batch(load_specs(args.specs), args.period, args.output, args.format, args.workers, store)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+'''Scenario Cache Module.
+
+This module provides a process-wide cache of the results of reform
+simulations, shared by all sessions and keyed by the reform fingerprint,
+with least recently used eviction under a memory budget.'''
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+def entry_nbytes(value) -> int:
+    """Memory used by cached results, as reported by their `nbytes`"""
+    return value.nbytes
+
+
+class ScenarioCache:
+    """
+    LRU cache bounded by the memory used by its entries.
+
+    Entry sizes are measured whenever the cache is trimmed.
+    """
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[Any], int] = entry_nbytes):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        # Keys never evicted, e.g. the baseline of each period
+        self.pinned = set()
+        self._lock = threading.RLock()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self.trim()
+
+    def pin(self, key: Hashable):
+        with self._lock:
+            self.pinned.add(key)
+
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(self.sizeof(value) for value in self._entries.values())
+
+    def trim(self):
+        """Evict the least recently used entries until the budget is met, keeping the most recent one"""
+        with self._lock:
+            sizes = OrderedDict((key, self.sizeof(value)) for key, value in self._entries.items())
+            total = sum(sizes.values())
+            most_recent = next(reversed(sizes), None)
+            for key, size in sizes.items():
+                if total <= self.max_bytes:
+                    break
+                if key in self.pinned or key == most_recent:
+                    continue
+                del self._entries[key]
+                total -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
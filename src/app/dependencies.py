@@ -0,0 +1,115 @@
+'''Variable Dependencies Module.
+
+This module records which variables and parameters each formula reads,
+from the trace of a baseline simulation, to find the variables a reform
+can change. All the other variables can be reused from the baseline.
+
+The OpenFisca tracer only records the parameters read as values: reading a
+tax scale (e.g. `parameters(period).impot.bareme.calc(...)`) leaves no
+trace. A change to a parameter the trace does not cover may therefore
+affect any variable.'''
+
+from typing import Dict, Iterable, List, Set
+
+from reform import parse_parameter_path
+
+
+def parameter_name(path: str) -> str:
+    """
+    Name of the parameter holding a tracked value, as recorded by the tracer.
+
+    Bracket values belong to their scale, e.g.
+    `impot.bareme.brackets[0].rate.2023_01_01` -> `impot.bareme`.
+    """
+    names = []
+    for step in parse_parameter_path(path):
+        if step == "brackets" or isinstance(step, int):
+            break
+        names.append(step)
+    return ".".join(names)
+
+
+class DependencyGraph:
+    def __init__(self, variables: Dict[str, Set[str]], parameters: Dict[str, Set[str]]):
+        # Variables read by each variable's formula
+        self.variables = variables
+        # Parameters read by each variable's formula
+        self.parameters = parameters
+        # Every parameter read by some formula
+        self.recorded_parameters: Set[str] = set().union(*parameters.values())
+
+    @classmethod
+    def from_tracer(cls, tracer) -> "DependencyGraph":
+        """Build the graph from the trees of a simulation run with `trace = True`"""
+        variables: Dict[str, Set[str]] = {}
+        parameters: Dict[str, Set[str]] = {}
+
+        stack = list(tracer.trees)
+        while stack:
+            node = stack.pop()
+            variables.setdefault(node.name, set()).update(child.name for child in node.children)
+            parameters.setdefault(node.name, set()).update(parameter.name for parameter in node.parameters)
+            stack.extend(node.children)
+
+        return cls(variables, parameters)
+
+    def __contains__(self, variable: str) -> bool:
+        return variable in self.variables
+
+    def is_traced(self, name: str) -> bool:
+        """Whether the reads of parameter `name` were recorded, as itself or as a parent"""
+        steps = name.split(".")
+        return any(".".join(steps[:length]) in self.recorded_parameters for length in range(1, len(steps) + 1))
+
+    def affected_variables(self, changed_paths: Iterable[str]) -> Set[str]:
+        """
+        Variables whose value may change when the parameters at `changed_paths`
+        change: every variable of the graph if one of them is not traced.
+        """
+        changed = {parameter_name(path) for path in changed_paths}
+        if not all(self.is_traced(name) for name in changed):
+            return set(self.variables)
+
+        def reads_changed(parameter: str) -> bool:
+            return any(
+                parameter == name or parameter.startswith(name + ".") or name.startswith(parameter + ".")
+                for name in changed
+            )
+
+        dependents: Dict[str, Set[str]] = {}
+        for variable, children in self.variables.items():
+            for child in children:
+                dependents.setdefault(child, set()).add(variable)
+
+        affected = {
+            variable
+            for variable, variable_parameters in self.parameters.items()
+            if any(reads_changed(parameter) for parameter in variable_parameters)
+        }
+        stack = list(affected)
+        while stack:
+            for dependent in dependents.get(stack.pop(), ()):
+                if dependent not in affected:
+                    affected.add(dependent)
+                    stack.append(dependent)
+        return affected
+
+    def dependencies_of(self, variable: str) -> Set[str]:
+        """Variables read, directly or not, by the formula of `variable`"""
+        seen: Set[str] = set()
+        stack = list(self.variables.get(variable, ()))
+        while stack:
+            child = stack.pop()
+            if child not in seen:
+                seen.add(child)
+                stack.extend(self.variables.get(child, ()))
+        return seen
+
+    def order(self, variables: Iterable[str]) -> List[str]:
+        """
+        `variables` in dependency order: a variable comes after those it reads,
+        as its dependencies strictly include theirs.
+        """
+        variables = list(dict.fromkeys(variables))
+        sizes = {variable: len(self.dependencies_of(variable)) for variable in variables}
+        return sorted(variables, key=lambda variable: (sizes[variable], variables.index(variable)))
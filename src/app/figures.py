@@ -0,0 +1,124 @@
+'''Figures Module.
+
+This module builds the plotly figures of the Results tab straight from the
+aggregates and pivot columns, and encodes them as compact JSON where the
+numeric arrays are base64 typed arrays. The encoded figures are kept per
+reform and shared by the sessions, so re-renders and tab switches reuse
+them; `www/figures.js` draws them with `Plotly.react`.'''
+
+import base64
+import json
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+MEASURE_TITLES = {"beneficiaries": "Bénéficiaires", "amount": "Montant"}
+AGGREGATES_SIMULATIONS = ("baseline", "reform", "absolute_difference")
+# Typed arrays understood by plotly.js, as numpy kind and item size
+TYPED_ARRAYS = ("f8", "f4", "i4", "u4", "i2", "u2", "i1", "u1")
+
+
+def _typed_array(array: np.ndarray) -> dict:
+    code = f"{array.dtype.kind}{array.dtype.itemsize}"
+    if code not in TYPED_ARRAYS:
+        # 64-bit integers and booleans have no typed array in plotly.js
+        code = "f8"
+    array = np.ascontiguousarray(array, dtype=f"<{code}")
+    return {"dtype": code, "bdata": base64.b64encode(array.tobytes()).decode()}
+
+
+def _encode(value):
+    if isinstance(value, np.ndarray):
+        return _typed_array(value) if value.dtype.kind in "fiub" else value.tolist()
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def encode_figure(fig) -> Tuple[dict, int]:
+    """
+    Figure as plain JSON data, its numeric arrays as base64 typed arrays,
+    and the size of its compact JSON text.
+    """
+    from plotly.utils import PlotlyJSONEncoder
+    text = json.dumps(_encode(fig.to_plotly_json()), cls=PlotlyJSONEncoder, separators=(",", ":"))
+    # Decoded back once, so the message holds no numpy or plotly objects
+    return json.loads(text), len(text)
+
+
+def aggregates_figure(aggregates_df: pd.DataFrame, measure: str = "beneficiaries"):
+    """Grouped horizontal bars of the raw aggregates, one trace per simulation"""
+    import plotly.graph_objects as go  # Imported on first use, to keep the startup fast
+    labels = aggregates_df["label"].to_numpy()
+    fig = go.Figure([
+        go.Bar(
+            name=simulation,
+            x=aggregates_df[f"{simulation}_{measure}"].to_numpy(dtype=float),
+            y=labels,
+            orientation="h",
+        )
+        for simulation in AGGREGATES_SIMULATIONS
+        if f"{simulation}_{measure}" in aggregates_df
+    ])
+    fig.update_layout(
+        barmode="group",
+        title=f"Baseline vs Reform : {MEASURE_TITLES[measure]}",
+        legend_title="simulation",
+    )
+    fig.update_xaxes(title_text=MEASURE_TITLES[measure])
+    fig.update_yaxes(title_text=None)
+    return fig
+
+
+def pivot_figure(table: pd.DataFrame, variable: str, aggfunc: str):
+    """One bar per parts fiscales group of a (group -> value) pivot table"""
+    import plotly.graph_objects as go  # Imported on first use, to keep the startup fast
+    values = table[variable].to_numpy(dtype=float)
+    fig = go.Figure([
+        go.Bar(name=str(group), x=[str(group)], y=values[position:position + 1])
+        for position, group in enumerate(table.index)
+    ])
+    fig.update_layout(
+        barmode="group",
+        title=f"Répartition de {variable} par parts fiscales ({aggfunc})",
+        xaxis_title="Parts Fiscales",
+        yaxis_title=f"Value ({aggfunc})",
+        legend_title="Parts Fiscales",
+    )
+    return fig
+
+
+class FigureCache:
+    """Encoded figures, least recently used first out"""
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        # Encoded figure and its size in bytes, by key
+        self._figures: "OrderedDict[Hashable, Tuple[dict, int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._figures)
+
+    def get(self, key: Hashable) -> Optional[dict]:
+        entry = self._figures.get(key)
+        if entry is None:
+            return None
+        self._figures.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, figure: dict, nbytes: int):
+        self._figures[key] = (figure, nbytes)
+        self._figures.move_to_end(key)
+        while len(self._figures) > self.max_entries:
+            self._figures.popitem(last=False)
+
+    def nbytes(self) -> int:
+        return sum(nbytes for _, nbytes in self._figures.values())
+
+
+# Shared by the sessions: the figures of a reform only depend on its results
+figure_cache = FigureCache()
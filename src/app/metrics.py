@@ -0,0 +1,183 @@
+'''Metrics Module.
+
+This module times the expensive steps of the app (UI building, change
+tracking, reform generation, simulations, aggregates, pivots and plots) and
+keeps memory snapshots. Each session records into its own histograms and
+into the process-wide ones; both are shown in the diagnostics panel and
+exported as plain text for a local scraper on `/metrics`.
+
+A measure costs a `perf_counter` call, a bisection over a dozen buckets and
+a lock, so the instrumentation can stay on in production.'''
+
+import os
+import resource
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the `q` quantile"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    def __init__(self, parent: Optional["Metrics"] = None):
+        # Process-wide metrics also fed by this instance
+        self.parent = parent
+        self.histograms: Dict[str, Histogram] = {}
+        self.gauges: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+        if self.parent is not None:
+            self.parent.observe(name, seconds)
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+        if self.parent is not None:
+            self.parent.set_gauge(name, value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Time the block; calls that raise (e.g. outputs waiting for a simulation) are not recorded"""
+        start = time.perf_counter()
+        yield
+        self.observe(name, time.perf_counter() - start)
+
+    def snapshot_memory(self, prefix: str = "memory"):
+        self.set_gauge(f"{prefix}.rss_bytes", process_rss_bytes())
+
+    def summary(self) -> pd.DataFrame:
+        """One row per timed step, in milliseconds"""
+        with self._lock:
+            rows = [
+                {
+                    "step": name,
+                    "calls": histogram.count,
+                    "total_ms": round(histogram.sum * 1000, 1),
+                    "mean_ms": round(histogram.sum / histogram.count * 1000, 2),
+                    "p50_ms": round(histogram.quantile(0.5) * 1000, 2),
+                    "p95_ms": round(histogram.quantile(0.95) * 1000, 2),
+                    "max_ms": round(histogram.max * 1000, 2),
+                }
+                for name, histogram in sorted(self.histograms.items())
+            ]
+        return pd.DataFrame(rows, columns=["step", "calls", "total_ms", "mean_ms", "p50_ms", "p95_ms", "max_ms"])
+
+    def samples(self, labels: str = "") -> Dict[str, Tuple[str, str, List[str]]]:
+        """Type, help text and sample lines of each metric family, in the Prometheus text format"""
+        families = {}
+        with self._lock:
+            for name, histogram in sorted(self.histograms.items()):
+                metric = _metric_name(name) + "_seconds"
+                lines = []
+                families[metric] = ("histogram", f"Duration of {name}, in seconds", lines)
+                cumulated = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulated += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    bucket_labels = _labels(labels, 'le="%s"' % le)
+                    lines.append(f"{metric}_bucket{bucket_labels} {cumulated}")
+                lines.append(f"{metric}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+            for name, value in sorted(self.gauges.items()):
+                metric = _metric_name(name)
+                families[metric] = ("gauge", f"Last value of {name}", [f"{metric}{_labels(labels)} {value}"])
+        return families
+
+
+def _metric_name(name: str) -> str:
+    return "reform_" + name.replace(".", "_").replace("-", "_")
+
+
+def _labels(*labels: str) -> str:
+    labels = ",".join(label for label in labels if label)
+    return "{" + labels + "}" if labels else ""
+
+
+def process_rss_bytes() -> int:
+    """Resident memory of the process (peak resident memory where /proc is missing)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# Metrics of the whole process, fed by every session
+process_metrics = Metrics()
+# Metrics of the open sessions, by session id
+session_metrics: Dict[str, Metrics] = {}
+
+
+def open_session_metrics(session_id: str) -> Metrics:
+    metrics = Metrics(parent=process_metrics)
+    session_metrics[session_id] = metrics
+    return metrics
+
+
+def close_session_metrics(session_id: str):
+    session_metrics.pop(session_id, None)
+
+
+def exposition(sources: Iterable[Tuple[str, Metrics]]) -> str:
+    """
+    Prometheus text exposition of (labels, metrics) sources: each family is
+    written once, with its HELP and TYPE lines, followed by the samples of
+    every source.
+    """
+    families: Dict[str, Tuple[str, str, List[str]]] = {}
+    for labels, metrics in sources:
+        for metric, (kind, help_text, lines) in metrics.samples(labels).items():
+            families.setdefault(metric, (kind, help_text, []))[2].extend(lines)
+
+    lines = []
+    for metric, (kind, help_text, samples) in sorted(families.items()):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines)
+
+
+def render_metrics() -> str:
+    """Text exposition of the process-wide metrics and of each open session, by `session` label"""
+    process_metrics.snapshot_memory()
+    sources = [("", process_metrics)]
+    sources.extend((f'session="{session_id}"', metrics) for session_id, metrics in list(session_metrics.items()))
+    return exposition(sources) + "\n"
@@ -0,0 +1,67 @@
+'''Lazy Parameter Panels Module.
+
+This module materializes the parameter accordion panels on the server the
+first time they are opened, so that only the top-level accordion is sent
+with the initial page.'''
+
+from typing import Callable, Dict, Iterable, Optional
+
+from shiny import reactive, ui
+
+from metrics import process_metrics
+from parameter import ParameterIndex, SimpleParameterTracker
+from ui import accordion_id, build_param_panel, panel_content_id
+
+# Panel contents only depend on the shared index, so they are built once per process
+_panel_cache: Dict[str, list] = {}
+
+
+def get_panel(index: ParameterIndex, path: str) -> list:
+    if path not in _panel_cache:
+        with process_metrics.timer("ui.build_param_panel"):
+            _panel_cache[path] = build_param_panel(index, path)
+    return _panel_cache[path]
+
+
+class LazyParamPanels:
+    def __init__(self, index: ParameterIndex, tracker: SimpleParameterTracker,
+                 on_materialize: Optional[Callable[[Iterable[str]], None]] = None):
+        self.index = index
+        self.tracker = tracker
+        # Called with the field ids of each newly displayed leaf
+        self.on_materialize = on_materialize
+        self._opened = set()
+
+    def register(self, input, session):
+        """Watch the top-level accordion and fill its panels on first opening"""
+        self._watch("", input, session)
+
+    def _watch(self, path: str, input, session):
+        node_accordion_id = accordion_id(path)
+
+        @reactive.effect
+        def _materialize():
+            opened = input[node_accordion_id]() or ()
+            for child_path in opened:
+                if child_path in self._opened:
+                    continue
+
+                self._opened.add(child_path)
+                ui.insert_ui(
+                    ui.div(*get_panel(self.index, child_path)),
+                    selector=f"#{panel_content_id(child_path)}",
+                    where="beforeEnd",
+                    session=session
+                )
+
+                if self.index.is_node(child_path):
+                    self._watch(child_path, input, session)
+                else:
+                    field_ids = self.index.leaves.get(child_path, ())
+                    self.tracker.track(field_ids)
+                    # Panels are cached with the initial values: show the edits made elsewhere (e.g. the search)
+                    for field_id in field_ids:
+                        if self.tracker.is_changed(field_id):
+                            ui.update_text(field_id, value=self.tracker.get_value(field_id), session=session)
+                    if self.on_materialize is not None:
+                        self.on_materialize(field_ids)
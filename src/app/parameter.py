@@ -1,88 +1,304 @@
 '''Parameters Tracker Module.
 
-This module provides classes to track changes in parameters, allowing for
-the management of initial and current values, as well as detecting changes.'''
+This module provides an immutable index of the parameter tree, built once
+and shared by all sessions, and classes to track each session's changes
+against it, as well as detecting changes.'''
 
-from typing import Dict, Set
-from shiny import ui
+from types import MappingProxyType
+from typing import Dict, Iterator, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from openfisca_core.parameters import ParameterScale
+
+from scale import BRACKET_KEYS, bracket_path, flatten_scale
+
+# Parameter Index
+
+# Code of each field kind in `ParameterIndex.kind_codes`
+KIND_CODES = {"value": 0, **{key: code for code, key in enumerate(BRACKET_KEYS, start=1)}}
+
+def parse_number(text: str) -> float:
+    """Numeric value of an input, NaN when it is not a number"""
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return float("nan")
+
+class IndexedField(NamedTuple):
+    field_id: str
+    path: str               # Original path, e.g. `impot.bareme.brackets[0].rate.2023_01_01`
+    node_path: str          # Path of the parameter (or scale) holding the value
+    instant: str
+    initial: str
+    kind: str               # "value" for simple parameters, bracket key otherwise
+    rank: Optional[int] = None
+
+def _scale_fields(node: ParameterScale, path: str, full_id: str) -> List[IndexedField]:
+    """Flatten the brackets of a ParameterScale, most recent instant first."""
+    scale_df = flatten_scale(node)
+
+    fields = []
+    for instant, row in zip(scale_df.index, scale_df.itertuples(index=False, name=None)):
+        for (rank, key), initial_value in zip(scale_df.columns, row):
+            if pd.isna(initial_value):
+                continue
+
+            fields.append(IndexedField(
+                field_id=f"{full_id}_bracket_{rank}_{key}_value_at_{instant.replace('-', '_')}",
+                path=f"{bracket_path(path, rank, key)}.{instant.replace('-', '_')}",
+                node_path=path,
+                instant=instant,
+                initial=initial_value,
+                kind=key,
+                rank=rank
+            ))
+
+    return fields
+
+def _simple_fields(node, path: str, full_id: str) -> List[IndexedField]:
+    """Flatten the values of a simple parameter."""
+    return [
+        IndexedField(
+            field_id=f"{full_id}_value_at_{param_at_instant.instant_str.replace('-', '_')}",
+            path=f"{path}.{param_at_instant.instant_str}",
+            node_path=path,
+            instant=param_at_instant.instant_str,
+            initial=str(param_at_instant.value),
+            kind="value"
+        )
+        for param_at_instant in getattr(node, "values_list", [])
+    ]
+
+def _description(node) -> str:
+    """Description and labels of a parameter, as found in its YAML file."""
+    metadata = getattr(node, "metadata", None) or {}
+    texts = [getattr(node, "description", None), metadata.get("label"), metadata.get("short_label")]
+    return " ".join(text for text in texts if isinstance(text, str))
+
+class ParameterIndex:
+    """
+    Read-only index of all the parameter values of a tax benefit system.
+
+    Built once at startup and shared by every session: maps each field_id to
+    its path, instant, initial value and kind, and keeps the tree structure
+    needed to build the UI.
+    """
+
+    def __init__(self, fields: Dict[str, IndexedField], children: Dict[str, Tuple[str, ...]],
+                 leaves: Dict[str, Tuple[str, ...]], scales: Set[str],
+                 descriptions: Optional[Dict[str, str]] = None):
+        self.fields: Mapping[str, IndexedField] = MappingProxyType(fields)
+        self.children: Mapping[str, Tuple[str, ...]] = MappingProxyType(children)
+        self.leaves: Mapping[str, Tuple[str, ...]] = MappingProxyType(leaves)
+        self.scales = frozenset(scales)
+        # Description and labels of each leaf parameter, for the search
+        self.descriptions: Mapping[str, str] = MappingProxyType(descriptions or {})
+
+        # Field ids interned to integer slots, in index order
+        self.field_ids: Tuple[str, ...] = tuple(fields)
+        self.slots: Mapping[str, int] = MappingProxyType({field_id: slot for slot, field_id in enumerate(self.field_ids)})
+        # Typed initial values by slot (NaN when not numeric) and kind code of each field
+        self.initial_numbers = np.array([parse_number(field.initial) for field in fields.values()], dtype=float)
+        self.kind_codes = np.array([KIND_CODES.get(field.kind, -1) for field in fields.values()], dtype=np.int8)
+        self.initial_numbers.setflags(write=False)
+        self.kind_codes.setflags(write=False)
+
+    @classmethod
+    def from_parameters(cls, root) -> "ParameterIndex":
+        """Flatten a parameter tree (e.g. `tbs.parameters`)"""
+        fields = {}
+        children = {}
+        leaves = {}
+        scales = set()
+        descriptions = {}
+
+        def walk(node, path: str):
+            if hasattr(node, "children") and node.children:
+                keys = []
+                for key, child in node.children.items():
+                    keys.append(key)
+                    walk(child, f"{path}.{key}" if path else key)
+                children[path] = tuple(keys)
+                return
+
+            full_id = path.replace(".", "")
+            if isinstance(node, ParameterScale):
+                scales.add(path)
+                node_fields = _scale_fields(node, path, full_id)
+            else:
+                node_fields = _simple_fields(node, path, full_id)
+
+            leaves[path] = tuple(field.field_id for field in node_fields)
+            descriptions[path] = _description(node)
+            for field in node_fields:
+                fields[field.field_id] = field
+
+        walk(root, "")
+        return cls(fields, children, leaves, scales, descriptions)
+
+    def __reduce__(self):
+        # Mapping proxies cannot be pickled: rebuild them from plain dicts (see `snapshot`)
+        return (type(self), (dict(self.fields), dict(self.children), dict(self.leaves), set(self.scales),
+                             dict(self.descriptions)))
+
+    def __getitem__(self, field_id: str) -> IndexedField:
+        return self.fields[field_id]
+
+    def __contains__(self, field_id: str) -> bool:
+        return field_id in self.fields
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+    def is_node(self, path: str) -> bool:
+        return path in self.children
+
+    def is_scale(self, path: str) -> bool:
+        return path in self.scales
+
+    def fields_of(self, path: str) -> List[IndexedField]:
+        """Fields of the leaf parameter at `path`"""
+        return [self.fields[field_id] for field_id in self.leaves.get(path, ())]
+
+    def fields_under(self, path: str) -> Iterator[str]:
+        """Field ids of every leaf below the node at `path`"""
+        if path in self.leaves:
+            yield from self.leaves[path]
+            return
+        for key in self.children.get(path, ()):
+            yield from self.fields_under(f"{path}.{key}" if path else key)
 
 # Tracker Classes
 
 class ChangeTracker:
-    def __init__(self):
-        self.initial_values: Dict[str, str] = {}
-        self.current_values: Dict[str, str] = {}
-        self.changed_fields: Set[str] = set()
-
-    def set_initial(self, field: str, value: str):
-        self.initial_values[field] = value
-        self.current_values[field] = value
-
-    def update_value(self, field: str, value: str):
-        self.current_values[field] = value
-        if value != self.initial_values[field]:
-            self.changed_fields.add(field)
+    """
+    Changes of a session against the shared index.
+
+    Fields are referred to by their integer slot in the index: a session
+    holds the slots of its displayed fields and the text of each edit, so
+    its memory grows with what it displayed and edited only.
+    """
+
+    __slots__ = ("index", "_tracked", "_overrides", "_invalid")
+
+    def __init__(self, index: ParameterIndex):
+        self.index = index
+        # Slots of the fields whose inputs were displayed
+        self._tracked: Set[int] = set()
+        # Current text of the edited fields, by slot
+        self._overrides: Dict[int, str] = {}
+        # Edited slots whose text is not a valid value for their field
+        self._invalid: Set[int] = set()
+
+    @property
+    def tracked(self) -> Set[str]:
+        return {self.index.field_ids[slot] for slot in self._tracked}
+
+    @property
+    def current_values(self) -> Dict[str, str]:
+        return {self.index.field_ids[slot]: text for slot, text in self._overrides.items()}
+
+    @property
+    def summary(self) -> Dict[int, str]:
+        """Line of the changes summary of each edited field, in index order"""
+        lines = {}
+        for slot in sorted(self._overrides):
+            field = self.index[self.index.field_ids[slot]]
+            warning = " ⚠️ valeur invalide" if slot in self._invalid else ""
+            lines[slot] = f"• {field.path}:\n  {field.initial.strip()} → {self._overrides[slot]}{warning}\n\n"
+        return lines
+
+    def track(self, fields):
+        self._tracked.update(self.index.slots[field] for field in fields)
+
+    def is_tracked(self, field: str) -> bool:
+        slot = self.index.slots.get(field)
+        return slot is not None and slot in self._tracked
+
+    def is_changed(self, field: str) -> bool:
+        return self.index.slots.get(field) in self._overrides
+
+    def get_value(self, field: str) -> str:
+        slot = self.index.slots[field]
+        return self._overrides[slot] if slot in self._overrides else self.index[field].initial
+
+    def update_value(self, field: str, value: str) -> bool:
+        """
+        Update one field; returns True if the deltas changed.
+
+        The value is parsed once here: numbers equal to the initial value
+        are not a change, and text that is not a number where one is
+        expected is kept but flagged as invalid.
+        """
+        slot = self.index.slots[field]
+        text = value.strip()
+        number = parse_number(text)
+        initial_number = self.index.initial_numbers[slot]
+        if np.isnan(initial_number):
+            unchanged = text == self.index[field].initial.strip()
         else:
-            self.changed_fields.discard(field)
+            unchanged = number == initial_number
 
-    def get_changed_values(self) -> Dict[str, str]:
-        return {field: self.current_values[field]
-                for field in self.changed_fields}
+        if unchanged:
+            if slot not in self._overrides:
+                return False
+            del self._overrides[slot]
+            self._invalid.discard(slot)
+            return True
 
-    def get_changed_fields(self) -> list:
-        return list(self.changed_fields)
+        invalid = bool(np.isnan(number)) and (not np.isnan(initial_number) or self.index.kind_codes[slot] > 0)
+        if self._overrides.get(slot) == text:
+            return False
+        self._overrides[slot] = text
+        if invalid:
+            self._invalid.add(slot)
+        else:
+            self._invalid.discard(slot)
+        return True
+
+    def reset_changes(self, path: str = "") -> Dict[str, str]:
+        """
+        Drop the edits of the fields under the node or leaf at `path` (all by
+        default); returns the initial values of the reset fields by field id.
+
+        Only the edits are walked, whatever the size of the subtree.
+        """
+        reset = {}
+        for slot in list(self._overrides):
+            field = self.index[self.index.field_ids[slot]]
+            if path and field.node_path != path and not field.node_path.startswith(path + "."):
+                continue
+            del self._overrides[slot]
+            self._invalid.discard(slot)
+            reset[field.field_id] = field.initial
+        return reset
+
+    def get_invalid_fields(self) -> list:
+        return [self.index.field_ids[slot] for slot in sorted(self._invalid)]
 
     def has_changes(self) -> bool:
-        return len(self.changed_fields) > 0
+        return len(self._overrides) > 0
 
 class SimpleParameterTracker(ChangeTracker):
-    def __init__(self):
-        super().__init__()
-        self.field_paths: Dict[str, str] = {}
-        self.session = None
+    """Per-session tracker storing only its deltas against the shared index"""
 
-    def set_session(self, session):
-        self.session = session
-
-    def set_initial_with_path(self, field_id: str, value: str, original_path: str):
-        self.set_initial(field_id, value)
-        self.field_paths[field_id] = original_path
+    __slots__ = ()
 
     def get_changed_by_path(self) -> Dict[str, str]:
         """Retourne les changements avec les valeurs ORIGINALES vs ACTUELLES"""
         changed = {}
-        for field_id in self.changed_fields:
-            original_path = self.field_paths.get(field_id, field_id)
-            changed[original_path] = {
-                'original': self.initial_values[field_id],
-                'current': self.current_values[field_id]
+        for slot in sorted(self._overrides):
+            field = self.index[self.index.field_ids[slot]]
+            changed[field.path] = {
+                'original': field.initial,
+                'current': self._overrides[slot]
             }
         return changed
 
     def get_changed_values_only(self) -> Dict[str, str]:
         """Retourne uniquement les valeurs actuelles des champs modifiés"""
         changed = {}
-        for field_id in self.changed_fields:
-            original_path = self.field_paths.get(field_id, field_id)
-            changed[original_path] = self.current_values[field_id]
+        for slot in sorted(self._overrides):
+            changed[self.index[self.index.field_ids[slot]].path] = self._overrides[slot]
         return changed
-
-    def reset_to_initial(self) -> Dict[str, str]:
-        """Reset et retourne les valeurs initiales"""
-        self.current_values = self.initial_values.copy()
-        self.changed_fields.clear()
-        return self.initial_values
-
-    def reset_field_ui(self, field_id: str):
-        """Reset un champ spécifique dans l'UI"""
-        if field_id in self.initial_values and self.session:
-            initial_value = self.initial_values[field_id]
-            ui.update_text(field_id, value=initial_value, session=self.session)
-            self.update_value(field_id, initial_value)
-
-    def reset_all_ui(self):
-        """Reset tous les champs dans l'UI"""
-        if self.session:
-            for field_id, initial_value in self.initial_values.items():
-                ui.update_text(field_id, value=initial_value, session=self.session)
-            self.reset_to_initial()
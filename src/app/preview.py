@@ -0,0 +1,93 @@
+'''Reform Preview Module.
+
+This module estimates the aggregates of a reform from a reproducible
+stratified subsample of foyers, in a fraction of the time of the full run.
+The baseline is known exactly on the whole survey, so only the reform -
+baseline difference is estimated, with a stratified variance giving the
+confidence intervals. The worker side lives in `simulation.run_preview`.'''
+
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_SAMPLE_SIZE = 5000
+# Quantile of the normal distribution for 95 % confidence intervals
+Z_95 = 1.959964
+
+
+def stratified_sample(strata: np.ndarray, size: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Proportional stratified sample of about `size` units, at least two per stratum.
+
+    Returns the sorted indices of the sampled units and their expansion
+    factors N_h / n_h. The same seed always draws the same sample.
+    """
+    rng = np.random.default_rng(seed)
+    _, codes = np.unique(strata, return_inverse=True)
+    population = np.bincount(codes)
+    allocation = np.minimum(population, np.maximum(2, np.round(size * population / len(codes)).astype(int)))
+
+    factors = np.zeros(len(codes))
+    selected = np.zeros(len(codes), dtype=bool)
+    for code, (stratum_size, stratum_sample) in enumerate(zip(population, allocation)):
+        chosen = rng.choice(np.flatnonzero(codes == code), size=stratum_sample, replace=False)
+        selected[chosen] = True
+        factors[chosen] = stratum_size / stratum_sample
+
+    indices = np.flatnonzero(selected)
+    return indices, factors[indices]
+
+
+def estimate_total(values: np.ndarray, factors: np.ndarray, strata: np.ndarray) -> Tuple[float, float]:
+    """Expanded total of the sampled `values` and its standard error, by stratum"""
+    total = float(np.sum(factors * values))
+    _, codes = np.unique(strata, return_inverse=True)
+    sampled = np.bincount(codes).astype(float)
+    population = np.bincount(codes, weights=factors)
+    sums = np.bincount(codes, weights=values)
+    squares = np.bincount(codes, weights=values ** 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variance = np.where(sampled > 1, (squares - sums ** 2 / sampled) / (sampled - 1), 0.0)
+        # Finite population correction: a fully sampled stratum adds no variance
+        stratum_variance = population ** 2 * (1 - sampled / population) * variance / sampled
+    return total, float(np.sqrt(np.nansum(stratum_variance)))
+
+
+def estimate_aggregates(baseline: Dict[str, np.ndarray], reform_sample: Dict[str, np.ndarray],
+                        weights: np.ndarray, strata: np.ndarray, indices: np.ndarray,
+                        factors: np.ndarray, labels: Dict[str, str]) -> pd.DataFrame:
+    """
+    Approximate aggregates of the reform: exact baseline totals on the whole
+    survey plus the estimated difference on the sample, with 95 % intervals.
+    """
+    rows = {}
+    for variable, reform_values in reform_sample.items():
+        baseline_values = np.asarray(baseline[variable], dtype=float)
+        reform_values = np.asarray(reform_values, dtype=float)
+        row = {"label": labels.get(variable, variable)}
+        for measure, transform in (("amount", lambda x: x), ("beneficiaries", lambda x: (x != 0).astype(float))):
+            baseline_total = float(np.sum(weights * transform(baseline_values)))
+            difference = weights[indices] * (transform(reform_values) - transform(baseline_values[indices]))
+            difference_total, standard_error = estimate_total(difference, factors, strata[indices])
+            row.update({
+                f"baseline_{measure}": baseline_total,
+                f"reform_{measure}": baseline_total + difference_total,
+                f"absolute_difference_{measure}": difference_total,
+                f"ci_low_{measure}": difference_total - Z_95 * standard_error,
+                f"ci_high_{measure}": difference_total + Z_95 * standard_error,
+            })
+        rows[variable] = row
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+
+class PreviewResults:
+    """Approximate aggregates of a reform, shown until its full run finishes"""
+
+    def __init__(self, period: int, fingerprint: str, aggregates: pd.DataFrame, sample_size: int, population: int):
+        self.period = period
+        self.fingerprint = fingerprint
+        self.aggregates = aggregates
+        # Number of sampled foyers, out of `population`
+        self.sample_size = sample_size
+        self.population = population
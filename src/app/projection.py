@@ -0,0 +1,111 @@
+'''Multi-Year Projection Module.
+
+This module applies a reform from the first day of a start year on, and
+simulates it over a range of years. Each year is a separate job on the
+simulation pool, so adding years uses more workers rather than more wall
+time. The aggregates of the years are merged into one time series.'''
+
+from typing import Dict
+
+import pandas as pd
+from shiny import reactive, render
+from shinywidgets import render_widget
+
+from parameter import SimpleParameterTracker
+from ranges import RangeInput
+from results import AGGREGATES_VARIABLES, ReformResults
+from worker import SimulationPool
+
+
+def projection_periods(start_year: int, end_year: int) -> range:
+    if int(end_year) < int(start_year):
+        raise ValueError("L'année de fin précède l'année de début de la projection.")
+    return range(int(start_year), int(end_year) + 1)
+
+
+def projection_frame(results_by_period: Dict[int, ReformResults], variables=AGGREGATES_VARIABLES) -> pd.DataFrame:
+    """Amounts and beneficiaries of each variable, one row per period and variable"""
+    rows = []
+    for period, results in sorted(results_by_period.items()):
+        aggregates = results.aggregates
+        simulations = ("baseline", "reform", "absolute_difference") if results.has_reform else ("baseline",)
+        for variable in variables:
+            if variable not in aggregates.index:
+                continue
+            row = aggregates.loc[variable]
+            rows.append({
+                "period": period,
+                "variable": variable,
+                "label": row["label"],
+                **{
+                    f"{simulation}_{measure}": float(row[f"{simulation}_{measure}"])
+                    for simulation in simulations
+                    for measure in ("amount", "beneficiaries")
+                },
+            })
+    return pd.DataFrame(rows)
+
+
+class ProjectionAnalysis:
+    def __init__(self, tracker: SimpleParameterTracker, period: int, pool: SimulationPool):
+        self.tracker = tracker
+        self.period = period
+        self.pool = pool
+
+    def register_outputs(self, input, output):
+        projection_range = RangeInput("Renseignez les années de début et de fin de la projection.")
+
+        @reactive.extended_task
+        async def run_projection(changes, periods, start):
+            return projection_frame(await self.pool.run_periods(changes, periods, start))
+
+        @reactive.effect
+        @reactive.event(input.projection_btn)
+        def _start_projection():
+            periods = projection_range.read(projection_periods, input.projection_start(), input.projection_end())
+            if periods is None:
+                return
+            changes = self.tracker.get_changed_values_only()
+            if run_projection.status() == "running":
+                run_projection.cancel()
+            # The changes apply from the first day of the start year on
+            run_projection.invoke(changes, list(periods), f"{periods.start}-01-01")
+
+        @output
+        @render.text
+        def projection_status():
+            if projection_range.error.get():
+                return projection_range.error.get()
+            status = run_projection.status()
+            if status == "running":
+                return "⏳ Projection en cours..."
+            if status == "error":
+                return f"❌ Erreur lors de la projection: {run_projection.error.get()}"
+            return ""
+
+        @output
+        @render_widget
+        def projection_plot():
+            df = run_projection.result()
+            value_columns = [column for column in df.columns if column.endswith("_amount")]
+            df_long = df.melt(id_vars=["period", "variable"], value_vars=value_columns,
+                              var_name="simulation", value_name="amount")
+            df_long["simulation"] = df_long["simulation"].str.removesuffix("_amount")
+            import plotly.express as px  # Imported on first use, to keep the startup fast
+            fig = px.line(
+                df_long,
+                x="period",
+                y="amount",
+                color="simulation",
+                facet_row="variable",
+                markers=True,
+                title="Projection pluriannuelle de la réforme"
+            )
+            fig.update_yaxes(matches=None, title_text=None)
+            fig.update_xaxes(title_text="Année", dtick=1)
+            return fig
+
+        @output
+        @render.data_frame
+        def projection_table():
+            return render.DataTable(run_projection.result(), filters=True, width="100%")
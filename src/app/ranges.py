@@ -0,0 +1,32 @@
+'''Range Inputs Module.
+
+This module reads the range of a batch of simulations, such as the values of
+a sweep or the years of a projection, from numeric inputs. An invalid range
+does not start the batch: the reason is kept for the status output instead.'''
+
+from typing import Callable, Optional, TypeVar
+
+from shiny import reactive
+
+T = TypeVar("T")
+
+
+class RangeInput:
+    def __init__(self, missing_message: str):
+        self.missing_message = missing_message
+        # Why the last click did not start a batch, if it did not
+        self.error = reactive.value("")
+
+    def read(self, build: Callable[..., T], *values) -> Optional[T]:
+        """Range built from the input `values`, or None after recording why it is invalid"""
+        # A cleared numeric input is None
+        if any(value is None for value in values):
+            self.error.set(f"⚠️ {self.missing_message}")
+            return None
+        try:
+            result = build(*values)
+        except ValueError as e:
+            self.error.set(f"⚠️ {e}")
+            return None
+        self.error.set("")
+        return result
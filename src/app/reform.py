@@ -1,6 +1,112 @@
+import ast
+import hashlib
+import json
+import re
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, Union
+
+from openfisca_core.reforms import Reform
+
 from parameter import SimpleParameterTracker
 
-def build_reform_code(tracker: SimpleParameterTracker, period: int) -> str:
+_BRACKET_STEP = re.compile(r"(\w+)\[(\d+)\]")
+
+def _canonical_value(path: str, value: str):
+    """Value as simulated: numbers compare equal whatever their spelling ("0.1", "0.10", "1e-1")"""
+    if not isinstance(value, str):
+        parsed = value
+    else:
+        try:
+            parsed = parse_value(path, value)
+        except ValueError:
+            # Refused before simulating; kept as text so that it still gets a key
+            return value.strip()
+    if isinstance(parsed, (int, float)) and not isinstance(parsed, bool):
+        return float(parsed)
+    return parsed
+
+def reform_fingerprint(changes: dict, period: int, start: Optional[str] = None) -> str:
+    """
+    Canonical hash of a set of parameter changes (path -> value) for a period,
+    or applied from the `start` instant on. Values are hashed as parsed.
+    """
+    canonical = {path: _canonical_value(path, value) for path, value in changes.items()}
+    content = {"changes": canonical, "period": period}
+    if start is not None:
+        content["start"] = start
+    payload = json.dumps(content, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+@lru_cache(maxsize=None)
+def parse_parameter_path(path: str) -> Tuple[Union[str, int], ...]:
+    """
+    Parses a tracked path into the steps leading to its parameter.
+
+    The trailing instant is dropped, e.g.
+    `impot.bareme.brackets[0].rate.2023_01_01` -> ("impot", "bareme", "brackets", 0, "rate").
+    """
+    steps = []
+    for name in path.rsplit(".", 1)[0].split("."):
+        match = _BRACKET_STEP.fullmatch(name)
+        if match:
+            steps += [match.group(1), int(match.group(2))]
+        else:
+            steps.append(name)
+    return tuple(steps)
+
+def format_parameter_path(steps: Tuple[Union[str, int], ...]) -> str:
+    """Python expression of parsed steps, relative to `parameters`"""
+    return "".join(f"[{step}]" if isinstance(step, int) else f".{step}" for step in steps)
+
+def resolve_parameter(parameters, steps: Tuple[Union[str, int], ...]):
+    node = parameters
+    for step in steps:
+        node = node[step] if isinstance(step, int) else getattr(node, step)
+    return node
+
+def parse_value(path: str, value: str):
+    """Parses a value as a Python literal, like the generated code does"""
+    try:
+        return ast.literal_eval(value.strip())
+    except (ValueError, SyntaxError):
+        raise ValueError(f"Valeur invalide pour {path}: {value}")
+
+def update_arguments(period: int, start: Optional[str] = None) -> Dict[str, str]:
+    """Arguments of `Parameter.update`: the whole `period`, or from the `start` instant on"""
+    return {"start": start} if start is not None else {"period": str(period)}
+
+def build_reform_from_changes(changes: Dict[str, str], period: int, start: Optional[str] = None) -> type:
+    """
+    Builds a Reform subclass in memory from changes (path -> current value),
+    applied to `period` or, when given, from the `start` instant on.
+    """
+    updates = [
+        (parse_parameter_path(path), parse_value(path, value))
+        for path, value in changes.items()
+    ]
+
+    arguments = update_arguments(period, start)
+
+    def modify_my_parameters(parameters):
+        for steps, value in updates:
+            resolve_parameter(parameters, steps).update(value=value, **arguments)
+        return parameters
+
+    class CustomReform(Reform):
+        def apply(self):
+            self.modify_parameters(modifier_function=modify_my_parameters)
+
+    return CustomReform
+
+def build_reform(tracker: SimpleParameterTracker, period: int) -> Optional[type]:
+    """
+    Builds the reform class based on the changes tracked, without generating code.
+    """
+    if tracker is None or not tracker.has_changes():
+        return None
+    return build_reform_from_changes(tracker.get_changed_values_only(), period)
+
+def build_reform_code(tracker: SimpleParameterTracker, period: int, start: Optional[str] = None) -> str:
     """
     Builds the Python code for the reform based on the changes tracked.
     """
@@ -8,6 +114,7 @@ def build_reform_code(tracker: SimpleParameterTracker, period: int) -> str:
         return ""
 
     changed_by_path = tracker.get_changed_by_path()
+    arguments = ", ".join(f'{name}="{value}"' for name, value in update_arguments(period, start).items())
     lines = [
         "from openfisca_core.reforms import Reform",
         "",
@@ -20,7 +127,7 @@ def build_reform_code(tracker: SimpleParameterTracker, period: int) -> str:
     ]
     for path, value in changed_by_path.items():
         lines += [
-            f"        parameters.{path[:-11]}.update(period=\"{period}\", value={value['current']})",
+            f"        parameters{format_parameter_path(parse_parameter_path(path))}.update({arguments}, value={value['current']})",
             "",
         ]
     lines += ["        return parameters"]
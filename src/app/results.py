@@ -0,0 +1,103 @@
+'''Reform Results Module.
+
+This module holds what the Results tab needs from a simulated reform: the
+aggregates frame and the arrays of the variables shown in the pivots. It is
+built in a worker process and sent back to the Shiny process, so it only
+contains plain data.'''
+
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+AGGREGATES_VARIABLES = ("revenu_net_global_imposable", "impot_brut", "impot_net")
+PIVOT_VARIABLES = ("impot_brut", "revenu_net_global_imposable", "impot_net")
+PIVOT_AGGFUNCS = ("sum", "mean", "count", "weighted_sum", "weighted_mean")
+PIVOT_GROUP_VARIABLE = "parts_fiscales"
+# Key of the survey weights in the arrays of each simulation
+WEIGHTS = "weights"
+# Version of the content of `ReformResults` and of its stored files, bumped
+# when either changes so that entries of an older layout are not read back
+RESULTS_SCHEMA_VERSION = 2
+
+
+def grouped_aggregates(codes: np.ndarray, groups: int, values: np.ndarray,
+                       weights: np.ndarray) -> Dict[str, np.ndarray]:
+    """Every aggregation function of `values` by group code, with one `np.bincount` per sum"""
+    count = np.bincount(codes, minlength=groups).astype(float)
+    total = np.bincount(codes, weights=values, minlength=groups)
+    weight_total = np.bincount(codes, weights=weights, minlength=groups)
+    weighted_total = np.bincount(codes, weights=values * weights, minlength=groups)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "sum": total,
+            "mean": total / count,
+            "count": count,
+            "weighted_sum": weighted_total,
+            "weighted_mean": weighted_total / weight_total,
+        }
+
+
+class ReformResults:
+    def __init__(self, period: int, fingerprint: str, aggregates: pd.DataFrame,
+                 labels: Dict[str, str], arrays: Dict[str, Dict[str, np.ndarray]]):
+        self.period = period
+        self.fingerprint = fingerprint
+        # Raw aggregates, as returned with `ignore_labels=True`
+        self.aggregates = aggregates
+        self.labels = labels
+        # Arrays by simulation ("baseline", "reform") and variable
+        self.arrays = arrays
+        # Pivots of every variable and aggregation function, by grouping variable
+        self._pivots: Dict[str, Dict[str, pd.DataFrame]] = {}
+
+    @property
+    def has_reform(self) -> bool:
+        return "reform" in self.arrays
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            int(self.aggregates.memory_usage(deep=True).sum())
+            + sum(array.nbytes for arrays in self.arrays.values() for array in arrays.values())
+        )
+
+    def labelled_aggregates(self) -> pd.DataFrame:
+        return self.aggregates.rename(columns=self.labels)
+
+    def pivots(self, by: str = PIVOT_GROUP_VARIABLE) -> Dict[str, pd.DataFrame]:
+        """
+        Pivots of all the variables by `by`, for each simulation: columns are
+        (variable, aggfunc) pairs. Computed in one pass per simulation, then
+        kept with the results, which are shared by the sessions.
+        """
+        if by not in self._pivots:
+            self._pivots[by] = {}
+            for simulation, arrays in self.arrays.items():
+                groups, codes = np.unique(arrays[by], return_inverse=True)
+                weights = np.asarray(arrays[WEIGHTS], dtype=float)
+                columns = {}
+                for variable, values in arrays.items():
+                    if variable in (by, WEIGHTS):
+                        continue
+                    aggregates = grouped_aggregates(codes, len(groups), np.asarray(values, dtype=float), weights)
+                    for aggfunc, column in aggregates.items():
+                        columns[(variable, aggfunc)] = column
+                self._pivots[by][simulation] = pd.DataFrame(columns, index=pd.Index(groups, name=by))
+        return self._pivots[by]
+
+    def pivot_table(self, variable: str, aggfunc: str = "sum",
+                    by: Optional[str] = PIVOT_GROUP_VARIABLE) -> pd.DataFrame:
+        """
+        Pivot of `variable` by `by`, as a reform - baseline difference when
+        a reform is applied (like `compute_pivot_table` with
+        `difference=True`; `weighted_*` aggfuncs use the survey weights).
+        """
+        tables = {
+            simulation: pivot[[(variable, aggfunc)]].set_axis([variable], axis=1)
+            for simulation, pivot in self.pivots(by).items()
+        }
+
+        if self.has_reform:
+            return tables["reform"].sub(tables["baseline"], fill_value=0)
+        return tables["baseline"]
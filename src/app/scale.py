@@ -0,0 +1,52 @@
+'''Scale Flattening Module.
+
+This module turns the brackets of a ParameterScale into a step-function
+table (one row per instant, one column per bracket rank and key), shared by
+the parameter index, the UI and the reform code generator.'''
+
+from typing import List, Tuple
+
+import pandas as pd
+from openfisca_core.parameters import ParameterScale
+
+BRACKET_KEYS = ('threshold', 'rate', 'amount')
+
+
+def bracket_path(path: str, rank: int, key: str) -> str:
+    """Path of a bracket parameter, e.g. `impot.bareme.brackets[0].rate`"""
+    return f"{path}.brackets[{rank}].{key}"
+
+
+def scale_records(node: ParameterScale) -> List[Tuple[str, int, str, str]]:
+    """Collect the (instant, rank, key, value) tuples of a scale in one pass."""
+    return [
+        (param_at_instant.instant_str, rank, key, str(param_at_instant.value))
+        for rank, bracket in enumerate(node.brackets)
+        for key in BRACKET_KEYS
+        if key in bracket.children
+        for param_at_instant in getattr(bracket.children[key], "values_list", [])
+    ]
+
+
+def flatten_scale(node: ParameterScale) -> pd.DataFrame:
+    """
+    Build the step-function table of a scale, most recent instant first.
+
+    Each (rank, key) column holds the value in force at each instant where
+    any bracket changes, forward-filled from its first definition.
+    """
+    records = scale_records(node)
+    if not records:
+        return pd.DataFrame()
+
+    # Keep the columns in bracket order rather than the sorted order of unstack
+    columns = pd.MultiIndex.from_tuples(dict.fromkeys((rank, key) for _, rank, key, _ in records))
+    table = (
+        pd.DataFrame.from_records(records, columns=["instant", "rank", "key", "value"])
+        .set_index(["instant", "rank", "key"])["value"]
+        .unstack(["rank", "key"])
+        .reindex(columns=columns)
+        .sort_index()
+        .ffill()
+    )
+    return table.sort_index(ascending=False)
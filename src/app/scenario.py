@@ -1,162 +1,295 @@
+from typing import Optional
+
 import pandas as pd
 from shiny import ui, render, reactive
-from shinywidgets import render_widget
-import plotly.express as px
 
+from figures import aggregates_figure, encode_figure, figure_cache, pivot_figure
+from metrics import Metrics, process_metrics
+from preview import PreviewResults
+from results import AGGREGATES_VARIABLES, ReformResults
+from worker import SimulationPool
+
+
+DEFAULT_AGGREGATES_VARIABLES = AGGREGATES_VARIABLES
 
-from openfisca_nouvelle_caledonie_data.survey_scenario import DSFSurveyScenario
-from openfisca_nouvelle_caledonie_data.aggregates import NouvelleCaledonieAggregates
+SIMULATION_STATUS = {
+    "initial": "",
+    "running": "⏳ Simulation en cours...",
+    "success": "✅ Résultats à jour.",
+    "cancelled": "Simulation annulée.",
+}
+
+# Seconds between two reads of the rows streamed by a running simulation
+STREAM_POLL_INTERVAL = 0.25
 
 
 class AbstractScenarioAnalysis:
-    def __init__(self, store_rx, tbs, period):
+    def __init__(self, store_rx, period, pool: Optional[SimulationPool] = None,
+                 metrics: Optional[Metrics] = None):
         self.store_rx = store_rx
-        self.tbs = tbs
         self.period = period
-        self.scenario = None
+        # Simulations run on a process pool shared by all sessions
+        self.pool = pool if pool is not None else SimulationPool()
+        self.metrics = metrics if metrics is not None else process_metrics
+        self.simulate = None
+        self.preview = None
+        # Rows streamed by the running simulation: (number of variables, rows, labels)
+        self.partial = reactive.value((0, (), {}))
+        # Aggregates of the current reform, keyed by (fingerprint, period, variables, ignore_labels)
+        self._aggregates_cache = {}
 
     def _get_reform_class(self):
         store = self.store_rx.get()
         return store.get("reform_class")
 
-    def aggregates(self, variables=["revenu_net_global_imposable", "impot_brut", "impot_net"], ignore_labels=False):
-        scenario = self._create_scenario()
-        aggregates = NouvelleCaledonieAggregates(scenario)
-        aggregates_df = aggregates.get_data_frame(default="baseline", ignore_labels=ignore_labels)
-        return aggregates_df
+    def _get_changes(self) -> dict:
+        store = self.store_rx.get()
+        if store.get("reform_class") is None:
+            return {}
+        return store.get("changes") or {}
 
-class ScenarioAnalysis(AbstractScenarioAnalysis):
-    def __init__(self, store_rx, tbs, period):
-        super().__init__(store_rx, tbs, period)
+    def _get_results(self) -> ReformResults:
+        """Results of the last simulation; outputs stay in progress while it runs"""
+        return self.simulate.result()
+
+    def _get_preview(self) -> Optional[PreviewResults]:
+        """Preview of the current reform while its full run is in progress, if any"""
+        if self.preview is None or self.simulate.status() != "running":
+            return None
+        if self.preview.status() != "success":
+            return None
+        return self.preview.result()
 
-    def _create_scenario(self):
-        reform_class = self._get_reform_class()
-        if reform_class:
-            if self.scenario is not None:
-                return self.scenario
+    def _get_partial(self) -> Optional[pd.DataFrame]:
+        """Raw aggregates rows streamed so far while the simulation runs, if any"""
+        if self.simulate is None or self.simulate.status() != "running":
+            return None
+        _, rows, _ = self.partial.get()
+        return pd.concat(rows) if rows else None
+
+    def aggregates(self, variables=DEFAULT_AGGREGATES_VARIABLES, ignore_labels=False):
+        """
+        Aggregates of `variables` in the current scenario, computed once per reform.
+
+        The worker computes every variable of `AGGREGATES_VARIABLES`: the rows
+        of `variables` are selected from them. The labelled table is derived
+        from the raw numeric frame, so both views cost a single aggregate pass.
+        """
+        results = self._get_results()
+        key = (results.fingerprint, results.period, tuple(variables), ignore_labels)
+        if key not in self._aggregates_cache:
+            if not any(cached[:2] == key[:2] for cached in self._aggregates_cache):
+                # Only keep the aggregates of the current reform
+                self._aggregates_cache = {}
+            aggregates_df = results.aggregates if ignore_labels else results.labelled_aggregates()
+            if tuple(variables) != tuple(aggregates_df.index):
+                aggregates_df = aggregates_df.loc[[variable for variable in variables if variable in aggregates_df.index]]
+            self._aggregates_cache[key] = aggregates_df
+        return self._aggregates_cache[key]
 
-            self.scenario = DSFSurveyScenario(self.period, reform=reform_class)
-            print(f"Scenario created with reform class: {reform_class.__name__}")
-        else:
-            self.scenario = DSFSurveyScenario(self.period)
-        return self.scenario
+    def encoded_figure(self, build, *arguments) -> dict:
+        """
+        Figure `build(*arguments)` of the current results, encoded by
+        `encode_figure`, built once per reform and arguments and shared by
+        the sessions.
+        """
+        results = self._get_results()
+        key = (results.fingerprint, results.period, build.__name__, *arguments)
+        figure = figure_cache.get(key)
+        if figure is None:
+            figure, nbytes = encode_figure(build(*arguments))
+            figure_cache.put(key, figure, nbytes)
+        return figure
+
+class ScenarioAnalysis(AbstractScenarioAnalysis):
+    def __init__(self, store_rx, period, pool: Optional[SimulationPool] = None,
+                 metrics: Optional[Metrics] = None):
+        super().__init__(store_rx, period, pool, metrics)
 
     def render_aggregates(self):
         return self.aggregates()
 
-    def render_aggregates_plot(self, measure: str = "beneficiaries"):
+    def render_aggregates_plot(self, measure: str = "beneficiaries", aggregates_df: Optional[pd.DataFrame] = None):
         """
         Render a bar plot for either 'beneficiaries' or 'amount' aggregates.
         measure: "beneficiaries" or "amount"
+        aggregates_df: raw aggregates to plot instead of the current results, e.g. streamed rows
         """
-        scenario = self._create_scenario()
-        if not scenario:
-            return None
-
-        aggregates_df = self.aggregates(ignore_labels=True)
-        df = pd.wide_to_long(
-            aggregates_df,
-            i=["label", "entity"],
-            j="type",
-            stubnames=["baseline", "reform", "relative_difference", "absolute_difference"],
-            sep="_",
-            suffix=r'\w+'
-        ).reset_index()
-        df_melted = df.melt(
-            id_vars=["label", "type"],
-            value_vars=["baseline", "reform", "absolute_difference"],
-            var_name="simulation",
-            value_name="value"
-        ).astype({'value': 'float'})
-        fig = px.bar(
-            df_melted[df_melted["type"] == measure],
-            x="value",
-            y="label",
-            color="simulation",
-            barmode="group",
-            orientation="h",
-            title=f"Baseline vs Reform : {'Bénéficiaires' if measure == 'beneficiaries' else 'Montant'}"
-        )
-        fig.update_xaxes(title_text="Bénéficiaires" if measure == "beneficiaries" else "Montant")
-        fig.update_yaxes(title_text=None)
-        return fig
+        if aggregates_df is None:
+            aggregates_df = self.aggregates(ignore_labels=True)
+        return aggregates_figure(aggregates_df, measure)
 
     def render_scenario_pivot_plot(self, selected_variable: str = "impot_brut", aggfunc: str = "sum"):
-        scenario = self._create_scenario()
-        if not scenario:
-            return None
-
-        df = scenario.compute_pivot_table(
-            values=[selected_variable],
-            columns=['parts_fiscales'],
-            aggfunc=aggfunc,
-            period=self.period,
-            difference=True,
-            weighted=False)
-        df_reset = df.reset_index()
-        df_melted = df_reset.melt(id_vars=df_reset.columns[0], var_name="Parts Fiscales", value_name="Value")
-
-        fig = px.bar(
-            df_melted,
-            x="Parts Fiscales",
-            y="Value",
-            color="Parts Fiscales",
-            barmode="group",
-            title=f"Répartition de {selected_variable} par parts fiscales ({aggfunc})",
-            labels={df_reset.columns[0]: "Parts Fiscales", "Value": selected_variable}
-        )
-        fig.update_layout(
-            xaxis_title="Parts Fiscales",
-            yaxis_title=f"Value ({aggfunc})",
-            legend_title="Parts Fiscales"
-        )
-        return fig
+        results = self._get_results()
+        return pivot_figure(results.pivot_table(selected_variable, aggfunc), selected_variable, aggfunc)
 
     def render_pivot_table(self, selected_variable: str = "impot_brut", aggfunc: str = "sum"):
-        scenario = self._create_scenario()
-        if not scenario:
-            return pd.DataFrame() # Return empty DataFrame if no scenario
+        results = self._get_results()
+        return results.pivot_table(selected_variable, aggfunc) # Return the pivot table as a DataFrame
+
+    def register_outputs(self, input, output, session):
+
+        progress_rx = reactive.value(None)
+
+        @reactive.extended_task
+        async def simulate(changes, period, progress=None):
+            with self.metrics.timer("scenario.simulation"):
+                results = await self.pool.run(changes, period, progress=progress)
+            self.metrics.set_gauge("memory.results_bytes", results.nbytes)
+            self.metrics.set_gauge("memory.cache_bytes", self.pool.cache.nbytes())
+            self.metrics.set_gauge("memory.figure_cache_bytes", figure_cache.nbytes())
+            self.metrics.snapshot_memory()
+            return results
+
+        @reactive.extended_task
+        async def preview(changes, period, sample_size):
+            with self.metrics.timer("scenario.preview"):
+                return await self.pool.run_preview(changes, period, sample_size)
+
+        self.simulate = simulate
+        self.preview = preview
 
-        df = scenario.compute_pivot_table(
-            values=[selected_variable],
-            index=['parts_fiscales'],
-            aggfunc=aggfunc,
-            period=self.period,
-            difference=True,
-            weighted=False)
-        return df # Return the pivot table as a DataFrame
+        @reactive.effect
+        def _submit_simulation():
+            changes = self._get_changes()
+            with reactive.isolate():
+                # A new reform supersedes the one still running for this session. Cancelling
+                # only drops a queued job: one already running in a worker completes, and its
+                # result is cached for a later identical reform
+                if simulate.status() == "running":
+                    simulate.cancel()
+                if preview.status() == "running":
+                    preview.cancel()
+                preview_mode = input.preview_mode()
+                sample_size = input.preview_sample_size()
+                stream_mode = input.stream_mode()
+            # The rows of the aggregates table are streamed as each variable is computed
+            progress = self.pool.progress_queue() if stream_mode else None
+            progress_rx.set(progress)
+            self.partial.set((0, (), {}))
+            simulate.invoke(changes, self.period, progress)
+            # The exact run goes on in the background and replaces the preview when done
+            if preview_mode and changes and sample_size:
+                preview.invoke(changes, self.period, int(sample_size))
 
-    def register_outputs(self, input, output):
+        @reactive.effect
+        def _poll_progress():
+            progress = progress_rx.get()
+            if progress is None or simulate.status() != "running":
+                return
+            reactive.invalidate_later(STREAM_POLL_INTERVAL)
+            messages = self.pool.drain(progress)
+            if not messages:
+                return
+            with reactive.isolate():
+                total, rows, labels = self.partial.get()
+            for message in messages:
+                if message[0] == "total":
+                    total = message[1]
+                else:
+                    _, row, row_labels = message
+                    rows = (*rows, row)
+                    labels = {**labels, **row_labels}
+            self.partial.set((total, rows, labels))
+
+        @output
+        @render.ui
+        def simulation_progress():
+            total, rows, _ = self.partial.get()
+            if not total or simulate.status() != "running":
+                return None
+            return ui.div(
+                ui.div(
+                    f"{len(rows)}/{total} variables",
+                    class_="progress-bar progress-bar-striped progress-bar-animated",
+                    role="progressbar",
+                    style=f"width: {100 * len(rows) / total:.0f}%"
+                ),
+                class_="progress mb-2"
+            )
+
+        @output
+        @render.text
+        def simulation_status():
+            status = simulate.status()
+            if status == "error":
+                return f"❌ Erreur lors de la simulation: {simulate.error.get()}"
+            approximate = self._get_preview()
+            if approximate is not None:
+                return (
+                    f"≈ Aperçu APPROXIMATIF sur {approximate.sample_size} foyers sur {approximate.population} "
+                    "(intervalles de confiance à 95 %), calcul complet en cours..."
+                )
+            return SIMULATION_STATUS.get(status, "")
 
         @output
         @render.data_frame
         def aggregates_table():
-            aggregates_df = self.render_aggregates()
+            streamed = self._get_partial()
+            if streamed is not None:
+                _, _, labels = self.partial.get()
+                return render.DataTable(streamed.rename(columns=labels), width="100%")
+            approximate = self._get_preview()
+            if approximate is not None:
+                return render.DataTable(approximate.aggregates.reset_index(names="variable"), width="100%")
+            with self.metrics.timer("scenario.aggregates"):
+                aggregates_df = self.render_aggregates()
             return render.DataTable(aggregates_df, filters=True, width="100%")
 
-        @output
-        @render_widget
-        def aggregates_amounts_plot():
-            return self.render_aggregates_plot(measure="amount")
+        async def send_figure(output_id: str, build, timer: str, streamed: bool = False):
+            """
+            Send the figure `build()` once the simulation succeeded, or while it
+            streams its rows when `build` plots them (`streamed`); a failed
+            simulation or figure is reported in place of the figure, as an
+            error raised in an effect would close the session.
+            """
+            status = simulate.status()
+            if status == "error":
+                message = {"id": output_id, "error": f"Erreur lors de la simulation: {simulate.error.get()}"}
+            elif status == "success" or (streamed and self._get_partial() is not None):
+                try:
+                    with self.metrics.timer(timer):
+                        message = {"id": output_id, "figure": build()}
+                except Exception as e:
+                    message = {"id": output_id, "error": f"Erreur lors du tracé: {e}"}
+            else:
+                # Initial, cancelled or still running: the last figure stays displayed
+                return
+            await session.send_custom_message("render_figure", message)
 
-        @output
-        @render_widget
-        def aggregates_beneficiaries_plot():
-            return self.render_aggregates_plot(measure="beneficiaries")
+        def aggregates_plot(measure: str) -> dict:
+            streamed = self._get_partial()
+            if streamed is not None:
+                # Streamed rows change until the run finishes: not cached
+                figure, _ = encode_figure(self.render_aggregates_plot(measure, streamed))
+                return figure
+            return self.encoded_figure(self.render_aggregates_plot, measure)
 
-        @output
-        @render_widget
-        @reactive.event(input.pivot_plot_variable, input.pivot_plot_aggfunc)
-        def scenario_pivot_plot():
+        @reactive.effect
+        async def aggregates_amounts_plot():
+            await send_figure("aggregates_amounts_plot", lambda: aggregates_plot("amount"), "scenario.aggregates_plot",
+                              streamed=True)
+
+        @reactive.effect
+        async def aggregates_beneficiaries_plot():
+            await send_figure("aggregates_beneficiaries_plot", lambda: aggregates_plot("beneficiaries"),
+                              "scenario.aggregates_plot", streamed=True)
+
+        @reactive.effect
+        async def scenario_pivot_plot():
             selected_variable = input.pivot_plot_variable()
             selected_aggfunc = input.pivot_plot_aggfunc()
-            return self.render_scenario_pivot_plot(selected_variable, selected_aggfunc)
+            await send_figure(
+                "scenario_pivot_plot",
+                lambda: self.encoded_figure(self.render_scenario_pivot_plot, selected_variable, selected_aggfunc),
+                "scenario.pivot_plot"
+            )
 
         @output
         @render.data_frame
-        @reactive.event(input.pivot_table_variable, input.pivot_table_aggfunc)
         def pivot_table_data():
             selected_variable = input.pivot_table_variable()
             selected_aggfunc = input.pivot_table_aggfunc()
-            df = self.render_pivot_table(selected_variable, selected_aggfunc)
+            with self.metrics.timer("scenario.pivot_table"):
+                df = self.render_pivot_table(selected_variable, selected_aggfunc)
             return render.DataTable(df.reset_index(), filters=True, width="100%")
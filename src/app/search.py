@@ -0,0 +1,178 @@
+'''Parameter Search Module.
+
+This module indexes the paths and descriptions of the leaf parameters with
+a prefix trie over their tokens and an inverted index from each token to
+the leaves, so that a query returns its best matches in milliseconds. Only
+the inputs of the matched leaves are rendered, with ids prefixed by
+`SEARCH_PREFIX` and kept in sync with the tracker and the accordion.'''
+
+import heapq
+import re
+import unicodedata
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from shiny import reactive, render, ui
+
+from parameter import ParameterIndex, SimpleParameterTracker
+from ui import build_search_results
+
+SEARCH_PREFIX = "search_"
+MIN_QUERY_LENGTH = 2
+# Weights of a token found in the path or only in the description
+PATH_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+
+_TOKEN_SEPARATOR = re.compile(r"[^a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case tokens without accents, split on anything but letters and digits"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(character for character in text if not unicodedata.combining(character))
+    return [token for token in _TOKEN_SEPARATOR.split(text) if token]
+
+
+class PrefixTrie:
+    """Character trie of the indexed tokens"""
+
+    _END = ""
+
+    def __init__(self):
+        self.root: Dict[str, dict] = {}
+
+    def insert(self, token: str):
+        node = self.root
+        for character in token:
+            node = node.setdefault(character, {})
+        node[self._END] = token
+
+    def complete(self, prefix: str) -> Iterator[str]:
+        """Every indexed token starting with `prefix`"""
+        node = self.root
+        for character in prefix:
+            node = node.get(character)
+            if node is None:
+                return
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for key, child in node.items():
+                if key == self._END:
+                    yield child
+                else:
+                    stack.append(child)
+
+
+class SearchIndex:
+    def __init__(self, paths: Tuple[str, ...], postings: Dict[str, Dict[int, int]]):
+        # Leaf paths, referred to by position in the postings
+        self.paths = paths
+        # Leaves and weight of each token
+        self.postings = postings
+        self.trie = PrefixTrie()
+        for token in postings:
+            self.trie.insert(token)
+
+    @classmethod
+    def from_index(cls, index: ParameterIndex) -> "SearchIndex":
+        paths = tuple(index.leaves)
+        postings: Dict[str, Dict[int, int]] = {}
+        for leaf, path in enumerate(paths):
+            for weight, text in ((DESCRIPTION_WEIGHT, index.descriptions.get(path, "")), (PATH_WEIGHT, path)):
+                for token in tokenize(text):
+                    leaves = postings.setdefault(token, {})
+                    leaves[leaf] = max(leaves.get(leaf, 0), weight)
+        return cls(paths, postings)
+
+    def search(self, query: str, limit: int = 20) -> List[str]:
+        """
+        Paths of the leaves matching every token of `query`, as a word or a
+        word prefix, best first: exact words and path matches score higher.
+        """
+        scores: Optional[Dict[int, int]] = None
+        for token in tokenize(query):
+            token_scores: Dict[int, int] = {}
+            for candidate in self.trie.complete(token):
+                bonus = 2 if candidate == token else 1
+                for leaf, weight in self.postings[candidate].items():
+                    token_scores[leaf] = max(token_scores.get(leaf, 0), weight * bonus)
+
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {leaf: score + token_scores[leaf] for leaf, score in scores.items() if leaf in token_scores}
+            if not scores:
+                return []
+
+        if not scores:
+            return []
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -len(self.paths[item[0]])))
+        return [self.paths[leaf] for leaf, _ in best]
+
+
+class SearchPanel:
+    def __init__(self, index: ParameterIndex, search_index: SearchIndex, tracker: SimpleParameterTracker,
+                 on_change: Optional[Callable[[str], None]] = None,
+                 on_track: Optional[Callable[[Iterable[str]], None]] = None, limit: int = 20):
+        self.index = index
+        self.search_index = search_index
+        self.tracker = tracker
+        # Called with the field id of each edit made in the search results
+        self.on_change = on_change
+        # Called with the field ids displayed by each search
+        self.on_track = on_track
+        self.limit = limit
+        # Field ids whose inputs are displayed in the search results
+        self.displayed = set()
+        self._observed = set()
+
+    def register(self, input, output, session):
+        matches = reactive.value(())
+
+        @reactive.effect
+        @reactive.event(input.param_search)
+        def _search():
+            query = (input.param_search() or "").strip()
+            paths = self.search_index.search(query, self.limit) if len(query) >= MIN_QUERY_LENGTH else []
+            displayed = set()
+            for path in paths:
+                field_ids = self.index.leaves.get(path, ())
+                self.tracker.track(field_ids)
+                displayed.update(field_ids)
+                for field_id in field_ids:
+                    self._observe(field_id, input)
+            self.displayed = displayed
+            if displayed and self.on_track is not None:
+                self.on_track(displayed)
+            matches.set(tuple(paths))
+
+        @output
+        @render.ui
+        def param_search_results():
+            paths = matches.get()
+            if not paths:
+                query = (input.param_search() or "").strip()
+                return ui.p("Aucun paramètre trouvé", class_="text-muted") if len(query) >= MIN_QUERY_LENGTH else None
+            with reactive.isolate():
+                values = {field_id: self.tracker.get_value(field_id) for field_id in self.displayed}
+            return build_search_results(self.index, paths, SEARCH_PREFIX, values)
+
+    def _observe(self, field_id: str, input):
+        if field_id in self._observed:
+            return
+        self._observed.add(field_id)
+
+        @reactive.effect
+        def _track_search_field():
+            value = input[SEARCH_PREFIX + field_id]()
+            if value is None:
+                return
+            with reactive.isolate():
+                changed = self.tracker.update_value(field_id, value)
+            if changed and self.on_change is not None:
+                self.on_change(field_id)
+
+    def sync(self, field_id: str, session):
+        """Show in the search results a value edited elsewhere"""
+        if field_id in self.displayed:
+            ui.update_text(SEARCH_PREFIX + field_id, value=self.tracker.get_value(field_id), session=session)
@@ -94,22 +94,77 @@
 
 
 
-from shiny import render, reactive
-from reform import build_reform_code
+from shiny import render, reactive, ui
+from metrics import close_session_metrics, open_session_metrics, process_metrics
+from reform import build_reform, build_reform_code
 from scenario import ScenarioAnalysis
-import tempfile
-import os
-import importlib.util
-
-def server_logic(input, output, session, param_tracker, tbs, period):
+from panels import LazyParamPanels
+from search import SEARCH_PREFIX, SearchPanel
+from sweep import SweepAnalysis
+from projection import ProjectionAnalysis
+from workspace import ReformWorkspace
+
+def server_logic(input, output, session, param_tracker, period, lazy=False, simulation_pool=None,
+                 search_index=None):
     reform_code_rx = reactive.value("")
     reform_status = reactive.value("")
     store_rx = reactive.value({})
+    # Bumped whenever a field edit changes the tracked deltas
+    changes_version = reactive.value(0)
+    # Bumped whenever new fields get displayed and tracked
+    tracked_version = reactive.value(0)
 
     # Flag to track if initialization is complete
     initialization_complete = reactive.value(False)
 
-    param_tracker.set_session(session)
+
+    # Timings of this session, also fed into the process-wide histograms
+    metrics = open_session_metrics(session.id)
+    session.on_ended(lambda: close_session_metrics(session.id))
+
+    search_panel = None
+
+    def observe_field(field_id: str):
+        # One observer per displayed field: an edit only touches its own entry
+        @reactive.effect
+        def _track_field():
+            current_value = input[field_id]()
+            if current_value is None:
+                return
+            with metrics.timer("tracker.update_value"):
+                changed = param_tracker.update_value(field_id, current_value)
+            if changed:
+                with reactive.isolate():
+                    changes_version.set(changes_version.get() + 1)
+                if search_panel is not None:
+                    search_panel.sync(field_id, session)
+
+    def observe_fields(field_ids):
+        for field_id in field_ids:
+            observe_field(field_id)
+        bump_tracked()
+
+    def bump_tracked():
+        with reactive.isolate():
+            tracked_version.set(tracked_version.get() + 1)
+
+    def search_edit(field_id: str):
+        # Edited in the search results: keep the accordion input in sync
+        with reactive.isolate():
+            changes_version.set(changes_version.get() + 1)
+        ui.update_text(field_id, value=param_tracker.get_value(field_id), session=session)
+
+    if search_index is not None:
+        search_panel = SearchPanel(param_tracker.index, search_index, param_tracker,
+                                   on_change=search_edit, on_track=lambda field_ids: bump_tracked())
+        search_panel.register(input, output, session)
+
+    if lazy:
+        panels = LazyParamPanels(param_tracker.index, param_tracker, on_materialize=observe_fields)
+        panels.register(input, session)
+    else:
+        param_tracker.track(param_tracker.index.fields)
+        observe_fields(param_tracker.index.fields)
 
     # Delay initialization to prevent false change detection
     @reactive.effect
@@ -118,52 +173,42 @@ def server_logic(input, output, session, param_tracker, tbs, period):
         reactive.invalidate_later(1.0)  # Wait 1 second
         initialization_complete.set(True)
 
-    # Improved change tracking that waits for initialization
-    @reactive.effect
-    def track_changes():
-        # Only start tracking after initialization is complete
-        if not initialization_complete.get():
-            return
-
-        for field_id in param_tracker.initial_values.keys():
-            input_attr = field_id.replace('-', '_')
-            if hasattr(input, input_attr):
-                try:
-                    current_value = getattr(input, input_attr)()
-                    # Only update if we have a meaningful change and value is not None
-                    if current_value is not None:
-                        param_tracker.update_value(field_id, current_value)
-                except Exception:
-                    # Skip inputs that aren't ready yet
-                    continue
-
     @render.text
-    @reactive.event(input.reset_all, *[getattr(input, field_id.replace('-', '_')) for field_id in param_tracker.initial_values.keys()])
+    @reactive.event(input.reset_all, changes_version)
     def changes_output():
         # Only show changes after initialization is complete
         if not initialization_complete.get():
             return "Initializing system..."
 
-        changed_by_path = param_tracker.get_changed_by_path()
-        if changed_by_path:
-            result = "Changements détectés:\n\n"
-            for path, values in changed_by_path.items():
-                # Double-check that values are actually different
-                original = str(values['original']).strip()
-                current = str(values['current']).strip()
-                if original != current:
-                    result += f"• {path}:\n  {original} → {current}\n\n"
-
-            if result == "Changements détectés:\n\n":
-                return "Aucune modification détectée"
-            return result
-        return "Aucune modification détectée"
+        # The summary only walks the edited fields
+        with metrics.timer("server.changes_output"):
+            summary = param_tracker.summary
+            if summary:
+                return "Changements détectés:\n\n" + "".join(summary.values())
+            return "Aucune modification détectée"
+
+    async def reset_fields(path: str = ""):
+        # Only the edited fields are reset, in a single message for the browser
+        reset = param_tracker.reset_changes(path)
+        if not reset:
+            return
+        await session.send_custom_message("reset_inputs", {"values": reset, "prefixes": ["", SEARCH_PREFIX]})
+        # The echoed input values match the tracker again: the field observers have nothing to do
+        with reactive.isolate():
+            changes_version.set(changes_version.get() + 1)
+
+    @reactive.effect
+    @reactive.event(input.reset_subtree)
+    async def reset_subtree():
+        with metrics.timer("server.reset_subtree"):
+            await reset_fields(input.reset_subtree())
 
     @reactive.effect
     @reactive.event(input.reset_all)
-    def reset_all():
+    async def reset_all():
         # Reset all values in the tracker
-        param_tracker.reset_all_ui()
+        with metrics.timer("server.reset_all"):
+            await reset_fields()
         reform_code_rx.set("")
         store_rx.set({"reform_class": None})
         reform_status.set("")
@@ -188,7 +233,8 @@ def server_logic(input, output, session, param_tracker, tbs, period):
             reform_code_rx.set("# Aucune modification détectée - aucun code à générer")
             return
 
-        reform_code = build_reform_code(param_tracker, period)
+        with metrics.timer("server.build_reform_code"):
+            reform_code = build_reform_code(param_tracker, period)
         reform_code_rx.set(reform_code)
 
     @render.download(filename="reform.py")
@@ -207,28 +253,25 @@ def server_logic(input, output, session, param_tracker, tbs, period):
             reform_status.set("Initialisation en cours...")
             return
 
-        code = reform_code_rx.get()
+        if not param_tracker.has_changes():
+            reform_status.set("Aucune modification à appliquer")
+            return
 
-        if not code or code.startswith("#"):
-            reform_status.set("Aucun code à exécuter - générez d'abord le code de réforme")
+        invalid_fields = param_tracker.get_invalid_fields()
+        if invalid_fields:
+            paths = ", ".join(param_tracker.index[field_id].path for field_id in invalid_fields)
+            reform_status.set(f"❌ Valeurs invalides: {paths}")
             return
 
         try:
-            with tempfile.TemporaryDirectory() as tempdir:
-                path = os.path.join(tempdir, "temp_module.py")
-                with open(path, "w", encoding='utf-8') as f:
-                    f.write(code)
-
-                spec = importlib.util.spec_from_file_location("temp_module", path)
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
-
-                if hasattr(module, "CustomReform"):
-                    reform_class = module.CustomReform
-                    store_rx.set({"reform_class": reform_class})
-                    reform_status.set("✅ Réforme appliquée avec succès.")
-                else:
-                    reform_status.set("❌ Erreur: Classe CustomReform non trouvée dans le module.")
+            # The reform class is built in memory; the generated code is only used for the download
+            with metrics.timer("server.build_reform"):
+                reform_class = build_reform(param_tracker, period)
+            store_rx.set({
+                "reform_class": reform_class,
+                "changes": param_tracker.get_changed_values_only()
+            })
+            reform_status.set("✅ Réforme appliquée avec succès, simulation lancée.")
 
         except Exception as e:
             reform_status.set(f"❌ Erreur lors de l'exécution: {str(e)}")
@@ -238,5 +281,43 @@ def server_logic(input, output, session, param_tracker, tbs, period):
         return reform_status.get()
 
     # Initialize scenario analysis
-    scenario_analysis = ScenarioAnalysis(store_rx, tbs, period)
-    scenario_analysis.register_outputs(input, output)
+    scenario_analysis = ScenarioAnalysis(store_rx, period, pool=simulation_pool, metrics=metrics)
+    scenario_analysis.register_outputs(input, output, session)
+
+    sweep_analysis = SweepAnalysis(param_tracker, period, simulation_pool)
+    sweep_analysis.register_outputs(input, output, tracked_version)
+
+    projection_analysis = ProjectionAnalysis(param_tracker, period, simulation_pool)
+    projection_analysis.register_outputs(input, output)
+
+    workspace = ReformWorkspace(param_tracker, period, simulation_pool)
+    workspace.register_outputs(input, output, session, changes_version)
+
+    # Diagnostics panel, only shown with `?diagnostics` in the URL
+    @reactive.effect
+    def _toggle_diagnostics():
+        if "diagnostics" not in (session.clientdata.url_search() or ""):
+            ui.nav_hide("main_navbar", "diagnostics")
+
+    def diagnostics_tick():
+        # Refresh while the panel is displayed
+        if input.main_navbar() == "diagnostics":
+            reactive.invalidate_later(2.0)
+
+    @render.data_frame
+    def diagnostics_session():
+        diagnostics_tick()
+        return render.DataTable(metrics.summary(), width="100%")
+
+    @render.data_frame
+    def diagnostics_process():
+        diagnostics_tick()
+        return render.DataTable(process_metrics.summary(), width="100%")
+
+    @render.text
+    def diagnostics_memory():
+        diagnostics_tick()
+        process_metrics.snapshot_memory()
+        return "\n".join(
+            f"{name}: {value / 1024 ** 2:.1f} Mo" for name, value in sorted(process_metrics.gauges.items())
+        )
@@ -0,0 +1,328 @@
+'''Simulation Jobs Module.
+
+This module holds the functions run by the simulation worker processes:
+they build the survey scenario of a reform and extract its results.'''
+
+import hashlib
+import importlib.util
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from openfisca_nouvelle_caledonie_data.survey_scenario import DSFSurveyScenario
+from openfisca_nouvelle_caledonie_data.aggregates import NouvelleCaledonieAggregates
+
+from dependencies import DependencyGraph
+from preview import DEFAULT_SAMPLE_SIZE, PreviewResults, estimate_aggregates, stratified_sample
+from reform import build_reform_from_changes, reform_fingerprint
+from results import AGGREGATES_VARIABLES, PIVOT_GROUP_VARIABLE, PIVOT_VARIABLES, WEIGHTS, ReformResults
+
+
+TARGET_VARIABLES = (*AGGREGATES_VARIABLES, *PIVOT_VARIABLES, PIVOT_GROUP_VARIABLE)
+
+
+class BaselineStore:
+    """
+    Baseline scenario of each period, built once per worker process.
+
+    The baseline only depends on the period and the input data, so its
+    computed variables are shared by every reform simulated in the process.
+    Its first computation is traced to record the dependencies of each
+    variable.
+
+    A baseline holds every computed variable of the survey, so besides the
+    pinned periods (warmed at startup) only the `max_periods` most recently
+    used ones are kept, e.g. the years of a projection.
+    """
+
+    def __init__(self, variables: Iterable[str] = TARGET_VARIABLES, max_periods: int = 2):
+        self.variables = tuple(dict.fromkeys(variables))
+        self.max_periods = max_periods
+        # Periods never evicted
+        self.pinned: Set[int] = set()
+        # (scenario, dependency graph) of each period, least recently used first
+        self._baselines: "OrderedDict[int, Tuple[object, DependencyGraph]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, period: int) -> bool:
+        return period in self._baselines
+
+    def _entry(self, period: int) -> Tuple[object, DependencyGraph]:
+        with self._lock:
+            if period not in self._baselines:
+                scenario = DSFSurveyScenario(period)
+                simulation = scenario.simulations["baseline"]
+                simulation.trace = True
+                for variable in self.variables:
+                    simulation.calculate(variable, period)
+                graph = DependencyGraph.from_tracer(simulation.tracer)
+                # The full tracer keeps every computed value, drop it
+                simulation.trace = False
+                self._baselines[period] = (scenario, graph)
+                self._evict()
+            self._baselines.move_to_end(period)
+            return self._baselines[period]
+
+    def _evict(self):
+        evictable = [period for period in self._baselines if period not in self.pinned]
+        # The baseline just built is the last one, it is always kept
+        for period in evictable[:max(0, len(evictable) - max(1, self.max_periods))]:
+            del self._baselines[period]
+
+    def get(self, period: int):
+        return self._entry(period)[0]
+
+    def simulation(self, period: int):
+        return self.get(period).simulations["baseline"]
+
+    def dependency_graph(self, period: int) -> DependencyGraph:
+        return self._entry(period)[1]
+
+baseline_store = BaselineStore()
+
+
+def warm_baseline(periods: Iterable[int]):
+    """Worker initializer: build and compute the baselines before the first job, and keep them"""
+    periods = tuple(periods)
+    baseline_store.pinned.update(periods)
+    for period in periods:
+        baseline_store.get(period)
+
+
+def reuse_baseline_variables(reform_simulation, baseline_simulation, graph: DependencyGraph,
+                             changed_paths: Iterable[str]) -> Set[str]:
+    """
+    Copy into the reform simulation the baseline values of the computed
+    variables the changed parameters cannot affect; returns the reused variables.
+    """
+    tax_benefit_system = baseline_simulation.tax_benefit_system
+    affected = graph.affected_variables(changed_paths)
+    reused = set()
+    for variable in graph.variables:
+        if variable in affected or tax_benefit_system.get_variable(variable).is_input_variable():
+            continue
+
+        baseline_holder = baseline_simulation.get_holder(variable)
+        holder = reform_simulation.get_holder(variable)
+        for known_period in baseline_holder.get_known_periods():
+            if holder.get_array(known_period) is None:
+                holder.put_in_cache(baseline_holder.get_array(known_period), known_period)
+        reused.add(variable)
+    return reused
+
+
+def create_reform_scenario(reform, period: int, changed_paths: Optional[Iterable[str]] = None):
+    """
+    Scenario of a reform class sharing the baseline of the period; when the
+    changed parameter paths are known, unaffected variables are reused.
+    """
+    scenario = DSFSurveyScenario(period, reform=reform)
+    # Reuse the shared baseline: only the reform branch gets simulated
+    baseline_simulation = baseline_store.simulation(period)
+    scenario.simulations["baseline"] = baseline_simulation
+    if changed_paths is not None:
+        # and only the variables downstream of the changed parameters are recomputed
+        reuse_baseline_variables(
+            scenario.simulations["reform"],
+            baseline_simulation,
+            baseline_store.dependency_graph(period),
+            changed_paths
+        )
+    return scenario
+
+
+def create_scenario(changes: Optional[Dict[str, str]], period: int, incremental: bool = True,
+                    start: Optional[str] = None):
+    if not changes:
+        return baseline_store.get(period)
+
+    reform = build_reform_from_changes(changes, period, start)
+    return create_reform_scenario(reform, period, changes.keys() if incremental else None)
+
+
+def load_reform_file(path: str) -> type:
+    """Load the `CustomReform` class of a generated reform.py file"""
+    spec = importlib.util.spec_from_file_location(f"reform_{hashlib.sha1(path.encode()).hexdigest()}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if not hasattr(module, "CustomReform"):
+        raise ValueError(f"Classe CustomReform non trouvée dans {path}")
+    return module.CustomReform
+
+
+def stream_aggregates(scenario, period: int, variables: Iterable[str], progress):
+    """
+    Aggregates of `variables` computed one variable at a time, in dependency
+    order, each row being put on the `progress` queue as soon as it is known.
+
+    Messages are ("total", count) first, then ("row", one-row DataFrame,
+    labels of its columns).
+    """
+    variables = list(variables)
+    ordered = baseline_store.dependency_graph(period).order(variables) if period in baseline_store else variables
+    progress.put(("total", len(ordered)))
+    rows = []
+    labels = {}
+    for variable in ordered:
+        aggregates = NouvelleCaledonieAggregates(scenario)
+        aggregates.aggregate_variables = [variable]
+        row = aggregates.get_data_frame(default="baseline", ignore_labels=True)
+        row_labels = dict(getattr(aggregates, "labels", {}))
+        labels.update(row_labels)
+        rows.append(row)
+        progress.put(("row", row, row_labels))
+    # The table keeps the order of `variables`, whatever the computation order
+    aggregates_df = pd.concat(rows)
+    return aggregates_df.reindex([variable for variable in variables if variable in aggregates_df.index]), labels
+
+
+def extract_results(scenario, period: int, fingerprint: str,
+                    variables: Iterable[str] = AGGREGATES_VARIABLES,
+                    pivot_variables: Iterable[str] = PIVOT_VARIABLES, progress=None) -> ReformResults:
+    if progress is None:
+        aggregates = NouvelleCaledonieAggregates(scenario)
+        aggregates.aggregate_variables = list(variables)
+        aggregates_df = aggregates.get_data_frame(default="baseline", ignore_labels=True)
+        labels = dict(getattr(aggregates, "labels", {}))
+    else:
+        aggregates_df, labels = stream_aggregates(scenario, period, variables, progress)
+
+    arrays = {
+        name: {
+            variable: simulation.calculate(variable, period)
+            for variable in (*pivot_variables, PIVOT_GROUP_VARIABLE)
+        }
+        for name, simulation in scenario.simulations.items()
+        if simulation is not None
+    }
+
+    # Survey weights of the entity the pivots are grouped on
+    for name, simulation in scenario.simulations.items():
+        if simulation is None:
+            continue
+        entity = simulation.tax_benefit_system.variables[PIVOT_GROUP_VARIABLE].entity.key
+        weight_variable = getattr(scenario, "weight_variable_by_entity", {}).get(entity)
+        if weight_variable is not None:
+            arrays[name][WEIGHTS] = simulation.calculate(weight_variable, period)
+        else:
+            # Without survey weights, each entity counts once
+            arrays[name][WEIGHTS] = np.ones(len(arrays[name][PIVOT_GROUP_VARIABLE]))
+
+    return ReformResults(period, fingerprint, aggregates_df, labels, arrays)
+
+
+def run_reform(changes: Optional[Dict[str, str]], period: int,
+               variables: Iterable[str] = AGGREGATES_VARIABLES, start: Optional[str] = None,
+               progress=None) -> ReformResults:
+    """
+    Simulate a reform given as changes (path -> value) on `period`, the
+    changes applying from `start` on when given; runs in a worker process.
+
+    With a `progress` queue, the aggregates rows are streamed on it as they
+    are computed (see `stream_aggregates`).
+    """
+    scenario = create_scenario(changes, period, start=start)
+    fingerprint = reform_fingerprint(changes, period, start) if changes else "baseline"
+    return extract_results(scenario, period, fingerprint, variables, progress=progress)
+
+
+def run_reform_file(path: str, period: int,
+                    variables: Iterable[str] = AGGREGATES_VARIABLES) -> ReformResults:
+    """Simulate the reform of a generated reform.py file; runs in a worker process"""
+    with open(path, "rb") as f:
+        fingerprint = hashlib.sha256(f.read() + str(period).encode()).hexdigest()
+    scenario = create_reform_scenario(load_reform_file(path), period)
+    return extract_results(scenario, period, fingerprint, variables)
+
+
+def subsample_simulation(simulation, entity_key: str, indices: np.ndarray, tax_benefit_system=None,
+                         drop_variables: Iterable[str] = ()):
+    """
+    Clone of `simulation` restricted to the `entity_key` entities at `indices`
+    and to their members; the other group entities only keep these members.
+
+    Known values are kept, except those of `drop_variables`, which get
+    recomputed with `tax_benefit_system` (e.g. a reform's) when requested.
+    """
+    sample = simulation.clone()
+    if tax_benefit_system is not None:
+        sample.tax_benefit_system = tax_benefit_system
+
+    person_key = simulation.persons.entity.key
+    person_mask = np.isin(simulation.populations[entity_key].members_entity_id, indices)
+    selections = {person_key: person_mask}
+    sample.persons.count = int(person_mask.sum())
+    sample.persons.ids = np.asarray(simulation.persons.ids)[person_mask]
+
+    for key, population in simulation.populations.items():
+        if key == person_key:
+            continue
+        members_entity_id = population.members_entity_id[person_mask]
+        kept = np.unique(members_entity_id)
+        new_id = np.full(population.count, -1)
+        new_id[kept] = np.arange(len(kept))
+
+        sample_population = sample.populations[key]
+        # The clone's groups still point to the full persons population
+        sample_population.members = sample.persons
+        sample_population.count = len(kept)
+        sample_population.ids = np.asarray(population.ids)[kept]
+        sample_population.members_entity_id = new_id[members_entity_id]
+        sample_population.members_role = population.members_role[person_mask]
+        sample_population._members_position = None
+        sample_population._ordered_members_map = None
+        selections[key] = kept
+
+    drop_variables = set(drop_variables)
+    for key, population in simulation.populations.items():
+        sample_population = sample.populations[key]
+        sample_population._holders = {}
+        for variable, holder in population._holders.items():
+            if variable in drop_variables:
+                continue
+            sample_holder = sample_population.get_holder(variable)
+            for known_period in holder.get_known_periods():
+                sample_holder.put_in_cache(holder.get_array(known_period)[selections[key]], known_period)
+    return sample
+
+
+def run_preview(changes: Dict[str, str], period: int, sample_size: int = DEFAULT_SAMPLE_SIZE, seed: int = 0,
+                variables: Iterable[str] = AGGREGATES_VARIABLES) -> PreviewResults:
+    """
+    Approximate aggregates of a reform, simulated on a stratified subsample of
+    the baseline's foyers; runs in a worker process.
+    """
+    scenario = baseline_store.get(period)
+    baseline = baseline_store.simulation(period)
+    tax_benefit_system = baseline.tax_benefit_system
+    entity = tax_benefit_system.variables[PIVOT_GROUP_VARIABLE].entity.key
+
+    strata = baseline.calculate(PIVOT_GROUP_VARIABLE, period)
+    weight_variable = getattr(scenario, "weight_variable_by_entity", {}).get(entity)
+    weights = (
+        np.asarray(baseline.calculate(weight_variable, period), dtype=float)
+        if weight_variable is not None else np.ones(len(strata))
+    )
+    indices, factors = stratified_sample(strata, sample_size, seed)
+
+    # Only the variables downstream of the changed parameters are simulated again on the sample
+    reform = build_reform_from_changes(changes, period)(tax_benefit_system)
+    affected = baseline_store.dependency_graph(period).affected_variables(changes.keys())
+    # Input variables hold the survey data: they are never recomputed
+    affected = {variable for variable in affected if not tax_benefit_system.get_variable(variable).is_input_variable()}
+    sample = subsample_simulation(baseline, entity, indices, reform, affected)
+
+    # The sample is drawn on one entity: the variables of the other entities are left out
+    variables = [variable for variable in variables if tax_benefit_system.variables[variable].entity.key == entity]
+    aggregates = estimate_aggregates(
+        {variable: baseline.calculate(variable, period) for variable in variables},
+        {variable: sample.calculate(variable, period) for variable in variables},
+        weights,
+        strata,
+        indices,
+        factors,
+        {variable: tax_benefit_system.variables[variable].label for variable in variables}
+    )
+    return PreviewResults(period, reform_fingerprint(changes, period), aggregates, len(indices), len(strata))
@@ -0,0 +1,78 @@
+'''Startup Snapshot Module.
+
+This module saves the parameter index and the static UI shell built from
+the country package, so that the next boots load them instead of parsing
+the parameter YAML files and walking the tree again. A snapshot is keyed by
+the versions of the country package and of the packages whose objects the
+UI shell pickles, and by the source of the modules that build the index and
+the UI.'''
+
+import glob
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from importlib import metadata
+from typing import Any, Optional, Tuple
+
+from parameter import ParameterIndex
+
+COUNTRY_PACKAGE = "openfisca-nouvelle-caledonie"
+# Packages whose tag objects are pickled in the UI shell
+UI_PACKAGES = ("shiny", "htmltools")
+# Modules whose code shapes the snapshot content, and the scripts the UI shell loads
+SNAPSHOT_SOURCES = ("parameter.py", "scale.py", "ui.py", "results.py", "preview.py", os.path.join("www", "*.js"))
+
+
+def snapshot_key(*options) -> Optional[str]:
+    """Key of the snapshot for the UI `options`, or None when a package version is unknown"""
+    try:
+        version = metadata.version(COUNTRY_PACKAGE)
+        ui_versions = [metadata.version(package) for package in UI_PACKAGES]
+    except metadata.PackageNotFoundError:
+        return None
+
+    digest = hashlib.sha256(f"{sys.version_info[:2]}-{ui_versions}-{options}".encode())
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for pattern in SNAPSHOT_SOURCES:
+        for path in sorted(glob.glob(os.path.join(directory, pattern))):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return f"{version}-{digest.hexdigest()[:16]}"
+
+
+def _snapshot_path(directory: str, key: str) -> str:
+    return os.path.join(directory, f"startup-{key}.pickle")
+
+
+def load_snapshot(directory: str, key: str) -> Optional[Tuple[ParameterIndex, Any]]:
+    """Return (index, UI shell) from a snapshot; the shell is None if it could not be saved"""
+    try:
+        with open(_snapshot_path(directory, key), "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        # Corrupted or written by incompatible code: rebuilt by the caller
+        return None
+
+
+def save_snapshot(directory: str, key: str, index: ParameterIndex, shell: Any):
+    try:
+        payload = pickle.dumps((index, shell), protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        # Some UI elements cannot be pickled: only the index is snapshotted
+        payload = pickle.dumps((index, None), protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.makedirs(directory, exist_ok=True)
+    # Written aside then renamed, so that concurrent boots never read a partial file
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, _snapshot_path(directory, key))
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
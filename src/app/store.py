@@ -0,0 +1,196 @@
+'''Result Store Module.
+
+This module persists the results of simulated reforms on disk, so that a
+restarted or newly started worker can serve them without simulating again.
+Each entry is a directory holding one `.npy` file per simulation and
+variable, read back with memory mapping, plus the aggregates (as Parquet,
+so that reloaded floats are bit-identical) and metadata.
+
+Stale entries can be purged from the command line:
+
+    uv run python src/app/store.py purge --max-age-days 30
+'''
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from importlib import metadata
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from results import RESULTS_SCHEMA_VERSION, ReformResults
+
+DATA_PACKAGES = ("openfisca-nouvelle-caledonie", "openfisca-nouvelle-caledonie-data")
+
+
+def dataset_version() -> str:
+    """Version of the country and data packages the results were computed with"""
+    if "REFORM_DATASET_VERSION" in os.environ:
+        return os.environ["REFORM_DATASET_VERSION"]
+
+    versions = []
+    for package in DATA_PACKAGES:
+        try:
+            versions.append(metadata.version(package))
+        except metadata.PackageNotFoundError:
+            versions.append("unknown")
+    return "-".join(versions)
+
+
+class ResultStore:
+    def __init__(self, root: str, version: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = root
+        # Results of other dataset versions or of an older results layout are never read
+        self.version = f"{version if version is not None else dataset_version()}-schema{RESULTS_SCHEMA_VERSION}"
+        self.max_bytes = max_bytes
+
+    def _entry_dir(self, fingerprint: str, period: int) -> str:
+        return os.path.join(self.root, self.version, str(period), fingerprint)
+
+    def __contains__(self, key: Tuple[str, int]) -> bool:
+        fingerprint, period = key
+        return os.path.exists(os.path.join(self._entry_dir(fingerprint, period), "meta.json"))
+
+    def load(self, fingerprint: str, period: int) -> Optional[ReformResults]:
+        entry_dir = self._entry_dir(fingerprint, period)
+        meta_path = os.path.join(entry_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        aggregates = pd.read_parquet(os.path.join(entry_dir, "aggregates.parquet"))
+
+        arrays = {
+            name: {
+                variable: np.load(os.path.join(entry_dir, name, f"{variable}.npy"), mmap_mode="r")
+                for variable in variables
+            }
+            for name, variables in meta["simulations"].items()
+        }
+        # The access time drives the eviction of the least recently used entries
+        os.utime(meta_path)
+        return ReformResults(meta["period"], meta["fingerprint"], aggregates, meta["labels"], arrays)
+
+    def save(self, results: ReformResults):
+        entry_dir = self._entry_dir(results.fingerprint, results.period)
+        if os.path.exists(entry_dir):
+            return
+
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        # Written aside then renamed, so that readers never see a partial entry
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=os.path.dirname(entry_dir))
+        try:
+            for name, arrays in results.arrays.items():
+                os.makedirs(os.path.join(tmp_dir, name))
+                for variable, array in arrays.items():
+                    np.save(os.path.join(tmp_dir, name, f"{variable}.npy"), np.asarray(array), allow_pickle=False)
+
+            results.aggregates.to_parquet(os.path.join(tmp_dir, "aggregates.parquet"))
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "period": results.period,
+                    "fingerprint": results.fingerprint,
+                    "labels": results.labels,
+                    "simulations": {name: list(arrays) for name, arrays in results.arrays.items()},
+                    "created": time.time(),
+                }, f)
+            os.replace(tmp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.exists(entry_dir):
+                raise
+
+        if self.max_bytes is not None:
+            self.prune(self.max_bytes)
+
+    def entries(self, all_versions: bool = False) -> Iterator[Tuple[str, float, int]]:
+        """Yield (directory, last access time, size in bytes) of each stored entry"""
+        versions = os.listdir(self.root) if all_versions and os.path.isdir(self.root) else [self.version]
+        for version in versions:
+            version_dir = os.path.join(self.root, version)
+            if not os.path.isdir(version_dir):
+                continue
+            for period in os.listdir(version_dir):
+                period_dir = os.path.join(version_dir, period)
+                for fingerprint in os.listdir(period_dir):
+                    if fingerprint.startswith("."):
+                        continue
+                    entry_dir = os.path.join(period_dir, fingerprint)
+                    meta_path = os.path.join(entry_dir, "meta.json")
+                    if not os.path.exists(meta_path):
+                        continue
+                    size = sum(
+                        os.path.getsize(os.path.join(dirpath, filename))
+                        for dirpath, _, filenames in os.walk(entry_dir)
+                        for filename in filenames
+                    )
+                    yield entry_dir, os.path.getmtime(meta_path), size
+
+    def prune(self, max_bytes: int) -> int:
+        """Remove the least recently used entries above `max_bytes`; returns the number removed"""
+        entries = sorted(self.entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        removed = 0
+        for entry_dir, _, size in entries:
+            if total <= max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def purge(self, max_age_days: Optional[float] = None) -> int:
+        """
+        Remove the entries of other dataset versions or results schemas, and those unused for
+        more than `max_age_days`; returns the number of removed directories.
+        """
+        removed = 0
+        if os.path.isdir(self.root):
+            for version in os.listdir(self.root):
+                if version != self.version:
+                    shutil.rmtree(os.path.join(self.root, version), ignore_errors=True)
+                    removed += 1
+
+        if max_age_days is not None:
+            limit = time.time() - max_age_days * 86400
+            for entry_dir, accessed, _ in list(self.entries()):
+                if accessed < limit:
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    removed += 1
+        return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gestion du cache disque des résultats de réformes")
+    parser.add_argument("--root", default=os.environ.get("REFORM_RESULT_STORE", ".reform_cache"))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    purge_parser = subparsers.add_parser("purge", help="Supprime les entrées obsolètes")
+    purge_parser.add_argument("--max-age-days", type=float, default=None)
+    purge_parser.add_argument("--max-bytes", type=int, default=None)
+
+    subparsers.add_parser("info", help="Affiche le contenu du cache")
+
+    args = parser.parse_args()
+    store = ResultStore(args.root)
+
+    if args.command == "purge":
+        removed = store.purge(max_age_days=args.max_age_days)
+        if args.max_bytes is not None:
+            removed += store.prune(args.max_bytes)
+        print(f"{removed} entrée(s) supprimée(s)")
+    else:
+        entries = list(store.entries(all_versions=True))
+        print(f"{len(entries)} entrée(s), {sum(size for _, _, size in entries) / 1024 ** 2:.1f} Mo")
+        for entry_dir, _, size in entries:
+            print(f"  {os.path.relpath(entry_dir, args.root)}  {size / 1024 ** 2:.1f} Mo")
+
+
+if __name__ == "__main__":
+    main()
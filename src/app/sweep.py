@@ -0,0 +1,126 @@
+'''Parameter Sweep Module.
+
+This module evaluates a batch of reforms where a single tracked field takes
+a range of values, and plots the response of an aggregate to that field.
+The points run in parallel on the simulation pool and share the baseline
+and the variables the swept parameter does not affect.'''
+
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+from shiny import reactive, render, ui
+from shinywidgets import render_widget
+
+from parameter import SimpleParameterTracker
+from ranges import RangeInput
+from results import ReformResults
+from worker import SimulationPool
+
+SWEEP_VARIABLE = "impot_net"
+
+
+def sweep_values(start: float, stop: float, steps: int) -> np.ndarray:
+    if int(steps) < 2:
+        raise ValueError("Le balayage compte au moins 2 points.")
+    return np.linspace(start, stop, int(steps))
+
+
+def sweep_changes(base_changes: Dict[str, str], path: str, values: Iterable[float]) -> List[Dict[str, str]]:
+    """One set of changes per swept value, on top of the session's other edits"""
+    return [{**base_changes, path: format(float(value), ".10g")} for value in values]
+
+
+def sweep_curve(values: Iterable[float], results: Iterable[ReformResults],
+                variable: str = SWEEP_VARIABLE) -> pd.DataFrame:
+    """Amount and beneficiaries of `variable` under each swept value"""
+    rows = []
+    for value, point in zip(values, results):
+        aggregates = point.aggregates.loc[variable]
+        simulation = "reform" if point.has_reform else "baseline"
+        rows.append({
+            "value": value,
+            "amount": float(aggregates[f"{simulation}_amount"]),
+            "beneficiaries": float(aggregates[f"{simulation}_beneficiaries"]),
+        })
+    return pd.DataFrame(rows)
+
+
+class SweepAnalysis:
+    def __init__(self, tracker: SimpleParameterTracker, period: int, pool: SimulationPool):
+        self.tracker = tracker
+        self.period = period
+        self.pool = pool
+
+    def register_outputs(self, input, output, tracked_version):
+        sweep_range = RangeInput("Renseignez le début, la fin et le nombre de points du balayage.")
+
+        @reactive.extended_task
+        async def run_sweep(base_changes, path, values, period):
+            jobs = sweep_changes(base_changes, path, values)
+            return path, sweep_curve(values, await self.pool.run_many(jobs, period))
+
+        @reactive.effect
+        def _update_fields():
+            tracked_version()
+            choices = {field_id: self.tracker.index[field_id].path for field_id in sorted(self.tracker.tracked)}
+            ui.update_selectize("sweep_field", choices=choices, server=True)
+
+        @reactive.effect
+        @reactive.event(input.sweep_field)
+        def _update_range():
+            field_id = input.sweep_field()
+            if not field_id:
+                return
+            try:
+                current = float(self.tracker.get_value(field_id))
+            except ValueError:
+                return
+            ui.update_numeric("sweep_start", value=current * 0.5)
+            ui.update_numeric("sweep_stop", value=current * 1.5 if current else 1)
+
+        @reactive.effect
+        @reactive.event(input.sweep_btn)
+        def _start_sweep():
+            field_id = input.sweep_field()
+            if not field_id:
+                return
+            path = self.tracker.index[field_id].path
+            base_changes = self.tracker.get_changed_values_only()
+            base_changes.pop(path, None)
+            values = sweep_range.read(sweep_values, input.sweep_start(), input.sweep_stop(), input.sweep_steps())
+            if values is None:
+                return
+            if run_sweep.status() == "running":
+                run_sweep.cancel()
+            run_sweep.invoke(base_changes, path, list(values), self.period)
+
+        @output
+        @render.text
+        def sweep_status():
+            if sweep_range.error.get():
+                return sweep_range.error.get()
+            status = run_sweep.status()
+            if status == "running":
+                return "⏳ Balayage en cours..."
+            if status == "error":
+                return f"❌ Erreur lors du balayage: {run_sweep.error.get()}"
+            return ""
+
+        @output
+        @render_widget
+        def sweep_plot():
+            path, curve = run_sweep.result()
+            df = curve.melt(id_vars="value", var_name="measure", value_name="result")
+            import plotly.express as px  # Imported on first use, to keep the startup fast
+            fig = px.line(
+                df,
+                x="value",
+                y="result",
+                facet_row="measure",
+                markers=True,
+                title=f"{SWEEP_VARIABLE} en fonction de {path}"
+            )
+            fig.update_yaxes(matches=None, title_text=None)
+            fig.update_xaxes(title_text="Valeur du paramètre")
+            return fig
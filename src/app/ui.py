@@ -1,69 +1,33 @@
-from typing import Optional
+import os
+from importlib.util import find_spec
+from itertools import groupby
+from typing import List, Mapping, Optional
 from shiny import ui
 from shinywidgets import output_widget
-import pandas as pd
-from openfisca_core.parameters import ParameterScale
-from parameter import SimpleParameterTracker
+from parameter import IndexedField, ParameterIndex
+from preview import DEFAULT_SAMPLE_SIZE
+from results import PIVOT_AGGFUNCS, PIVOT_VARIABLES
 
-def _create_bracket_inputs(node: ParameterScale, path: str, full_id: str, tracker: SimpleParameterTracker) -> list:
-    """Helper function to create bracket inputs for ParameterScale nodes."""
-    scale_df = pd.DataFrame()
-
-    # Build the DataFrame for scale parameters
-    for rank, bracket in enumerate(node.brackets):
-        bracket_df = pd.DataFrame()
-
-        for key in ['threshold', 'rate', 'amount']:
-            child = bracket.children.get(key)
-            if child is None:
-                continue
-
-            for param_at_instant in getattr(child, "values_list", []):
-                initial_value = str(param_at_instant.value)
-                date = param_at_instant.instant_str
-                bracket_df.at[date, key] = initial_value
-
-        if not bracket_df.empty:
-            scale_df = pd.concat([scale_df, pd.concat([bracket_df], keys=[rank], axis=1)], axis=1)
-
-    if scale_df.empty:
-        return []
-
-    # Sort and forward fill
-    scale_df = scale_df.sort_index()
-    for col in scale_df.columns:
-        first_valid = scale_df[col].first_valid_index()
-        if first_valid is not None:
-            scale_df.loc[first_valid:, col] = scale_df.loc[first_valid:, col].ffill()
-
-    scale_df = scale_df.sort_index(ascending=False)
+def _create_bracket_inputs(fields: List[IndexedField], prefix: str = "",
+                           values: Optional[Mapping[str, str]] = None) -> list:
+    """
+    Helper function to create bracket inputs for ParameterScale nodes.
 
-    # Create input elements
+    Input ids are the field ids with `prefix`; `values` overrides the initial values.
+    """
+    values = values or {}
     inputs = []
-    for instant in scale_df.index:
-        input_elements = []
-
-        for col, series in scale_df.items():
-            rank, key = col
-            initial_value = series[instant]
-
-            if pd.isna(initial_value):
-                continue
 
-            field_id = f"{full_id}_bracket_{rank}_{key}_value_at_{instant.replace('-', '_')}"
-            original_path = f"{path}.brackets[{rank}].{key}.{instant.replace('-', '_')}"
-
-            # Register with tracker - this should happen BEFORE input creation
-            # and we need to ensure the tracker doesn't immediately flag this as changed
-            tracker.set_initial_with_path(field_id, initial_value, original_path)
-
-            input_elements.append(
-                ui.input_text(
-                    field_id,
-                    f"Bracket {rank} {key}",
-                    value=initial_value
-                )
+    # Fields come flattened by instant, most recent first
+    for instant, instant_fields in groupby(fields, key=lambda field: field.instant):
+        input_elements = [
+            ui.input_text(
+                prefix + field.field_id,
+                f"Bracket {field.rank} {field.kind}",
+                value=values.get(field.field_id, field.initial)
             )
+            for field in instant_fields
+        ]
 
         if input_elements:
             inputs.extend([
@@ -77,24 +41,19 @@ def _create_bracket_inputs(node: ParameterScale, path: str, full_id: str, tracke
 
     return inputs
 
-def _create_simple_inputs(node, path: str, full_id: str, tracker: SimpleParameterTracker) -> list:
-    """Helper function to create simple parameter inputs."""
+def _create_simple_inputs(fields: List[IndexedField], prefix: str = "",
+                          values: Optional[Mapping[str, str]] = None) -> list:
+    """Helper function to create simple parameter inputs (see `_create_bracket_inputs`)."""
+    values = values or {}
     inputs = []
 
-    for param_at_instant in getattr(node, "values_list", []):
-        field_id = f"{full_id}_value_at_{param_at_instant.instant_str.replace('-', '_')}"
-        initial_value = str(param_at_instant.value)
-        original_path = f"{path}.{param_at_instant.instant_str}"
-
-        # Register with tracker BEFORE input creation
-        tracker.set_initial_with_path(field_id, initial_value, original_path)
-
+    for field in fields:
         inputs.append(
             ui.div(
                 ui.input_text(
-                    field_id,
-                    f"Value at {param_at_instant.instant_str}",
-                    value=initial_value
+                    prefix + field.field_id,
+                    f"Value at {field.instant}",
+                    value=values.get(field.field_id, field.initial)
                 ),
                 class_="mb-2"
             )
@@ -102,33 +61,106 @@ def _create_simple_inputs(node, path: str, full_id: str, tracker: SimpleParamete
 
     return inputs
 
-def build_param_ui(node, path: str = "", tracker: Optional[SimpleParameterTracker] = None):
+# Scripts of the app and plotly.js, served as static assets (not copied by
+# shiny, so that a snapshotted UI shell keeps pointing at them)
+WWW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "www")
+# plotly.js as shipped with the plotly package, found without importing it
+PLOTLY_DIR = os.path.join(find_spec("plotly").submodule_search_locations[0], "package_data")
+STATIC_ASSETS = {"/www": WWW_DIR, "/plotly": PLOTLY_DIR}
+
+def _script(src: str) -> ui.Tag:
+    return ui.tags.script(src=src)
+
+def figure_output(output_id: str) -> ui.Tag:
+    """Container of a figure drawn by `www/figures.js` from the `render_figure` messages."""
+    return ui.div(id=output_id, class_="reform-figure", style="min-height: 450px;")
+
+def _reset_button(path: str) -> ui.Tag:
+    """Button resetting the edited fields under `path`, reported through the `reset_subtree` input."""
+    return ui.tags.button(
+        "↺ Réinitialiser",
+        type="button",
+        class_="btn btn-sm btn-outline-warning mb-2",
+        onclick="Shiny.setInputValue('reset_subtree', this.dataset.path, {priority: 'event'})",
+        **{"data-path": path}
+    )
+
+def accordion_id(path: str) -> str:
+    """Id of the accordion listing the children of the node at `path`."""
+    return f"param_{path.replace('.', '__')}_accordion" if path else "param_root_accordion"
+
+def panel_content_id(path: str) -> str:
+    """Id of the placeholder filled when the panel of the node at `path` is opened."""
+    return f"param_{path.replace('.', '__')}_content"
+
+def build_lazy_param_ui(index: ParameterIndex, path: str = "") -> list:
+    """
+    Build a single accordion level whose panels are empty placeholders.
+
+    The content of each panel is built on the server the first time the panel
+    is opened (see `panels.LazyParamPanels`).
+
+    Args:
+        index: Parameter index
+        path: Path of the node whose children become accordion panels
+
+    Returns:
+        List of UI elements
+    """
+    if not index.is_node(path):
+        return []
+
+    items = []
+    for key in index.children[path]:
+        child_path = f"{path}.{key}" if path else key
+        items.append(
+            ui.accordion_panel(
+                key,
+                _reset_button(child_path),
+                ui.div(id=panel_content_id(child_path)),
+                value=child_path
+            )
+        )
+
+    return [ui.accordion(*items, id=accordion_id(path), open=False, multiple=True)]
+
+def build_param_panel(index: ParameterIndex, path: str) -> list:
+    """
+    Build the content of the accordion panel of a node, one level deep.
+
+    Nested nodes are rendered as a lazy accordion, leaves as inputs.
+    """
+    if index.is_node(path):
+        return build_lazy_param_ui(index, path)
+    return build_param_ui(index, path=path)
+
+def build_param_ui(index: Optional[ParameterIndex], path: str = ""):
     """
     Build parameter UI with change tracking.
 
     Args:
-        node: Parameter node to build UI for
+        index: Parameter index
         path: Current parameter path
-        tracker: Parameter change tracker
 
     Returns:
         List of UI elements
     """
-    if tracker is None:
-        raise ValueError("Tracker is required for parameter UI building")
+    if index is None:
+        raise ValueError("Index is required for parameter UI building")
 
     items = []
 
     # Handle nodes with children (create accordion)
-    if hasattr(node, "children") and node.children:
-        for key, child in node.children.items():
+    if index.is_node(path):
+        for key in index.children[path]:
             child_path = f"{path}.{key}" if path else key
-            child_ui = build_param_ui(child, path=child_path, tracker=tracker)
+            child_ui = build_param_ui(index, path=child_path)
 
             if child_ui:  # Only add if there are UI elements
                 items.append(
                     ui.accordion_panel(
                         key,  #.replace("_", " ").title(),  # Better display name
+                        _reset_button(child_path),
                         *child_ui
                     )
                 )
@@ -136,13 +168,38 @@ def build_param_ui(node, path: str = "", tracker: Optional[SimpleParameterTracke
         return [ui.accordion(*items, open=False, multiple=True)] if items else []
 
     # Handle leaf nodes
-    # full_id = path.replace(".", "_")  # Use underscore for cleaner IDs
-    full_id = path.replace(".", "")
-
-    if isinstance(node, ParameterScale):
-        return _create_bracket_inputs(node, path, full_id, tracker)
+    if index.is_scale(path):
+        return _create_bracket_inputs(index.fields_of(path))
     else:
-        return _create_simple_inputs(node, path, full_id, tracker)
+        return _create_simple_inputs(index.fields_of(path))
+
+def build_search_results(index: ParameterIndex, paths: List[str], prefix: str,
+                         values: Mapping[str, str]) -> ui.Tag:
+    """
+    Build the inputs of the leaf parameters matched by a search.
+
+    Args:
+        index: Parameter index
+        paths: Paths of the matched leaves, best first
+        prefix: Prefix of the input ids, distinct from the accordion's
+        values: Current values of the session, by field id
+
+    Returns:
+        UI element
+    """
+    items = []
+    for path in paths:
+        fields = index.fields_of(path)
+        create_inputs = _create_bracket_inputs if index.is_scale(path) else _create_simple_inputs
+        items.append(
+            ui.div(
+                ui.h6(path, class_="mb-1"),
+                ui.p(index.descriptions.get(path, ""), class_="text-muted small mb-2"),
+                *create_inputs(fields, prefix=prefix, values=values),
+                class_="border rounded p-2 mb-2"
+            )
+        )
+    return ui.div(*items)
 
 def build_results_ui():
     """Build the results section UI."""
@@ -154,6 +211,28 @@ def build_results_ui():
             ui.card_body(
                 ui.p("This section displays the results of the applied reform.",
                      class_="text-muted mb-3"),
+                ui.layout_columns(
+                    ui.input_checkbox(
+                        "preview_mode",
+                        "Aperçu rapide sur un échantillon",
+                        value=False
+                    ),
+                    ui.input_numeric(
+                        "preview_sample_size",
+                        "Taille de l'échantillon (foyers)",
+                        value=DEFAULT_SAMPLE_SIZE,
+                        min=100,
+                        step=500
+                    ),
+                    ui.input_checkbox(
+                        "stream_mode",
+                        "Afficher les résultats au fil du calcul",
+                        value=False
+                    ),
+                    col_widths=[4, 4, 4]
+                ),
+                ui.output_ui("simulation_progress"),
+                ui.output_text("simulation_status"),
                 ui.output_data_frame("aggregates_table")
             )
         ),
@@ -162,62 +241,166 @@ def build_results_ui():
                 ui.h4("📈 Scenario Analysis", class_="mb-0")
             ),
             ui.card_body(
-                output_widget("aggregates_amounts_plot"),
+                figure_output("aggregates_amounts_plot"),
                 ui.hr(),
-                output_widget("aggregates_beneficiaries_plot"),
+                figure_output("aggregates_beneficiaries_plot"),
                 ui.hr(),
                 ui.input_select(
                     "pivot_plot_variable",
                     "Select variable to plot",
-                    choices=["impot_brut", "revenu_net_global_imposable", "impot_net"],
+                    choices=list(PIVOT_VARIABLES),
                     selected="impot_brut",
                 ),
                 ui.input_select(
                     "pivot_plot_aggfunc",
                     "Select aggregation function",
-                    choices=["sum", "mean"],
+                    choices=list(PIVOT_AGGFUNCS),
                     selected="sum",
                 ),
-                output_widget("scenario_pivot_plot"),
+                figure_output("scenario_pivot_plot"),
                 ui.hr(),
                 ui.h4("Pivot Table Data"),
                 ui.input_select(
                     "pivot_table_variable",
                     "Select variable for table",
-                    choices=["impot_brut", "revenu_net_global_imposable", "impot_net"],
+                    choices=list(PIVOT_VARIABLES),
                     selected="impot_brut",
                 ),
                 ui.input_select(
                     "pivot_table_aggfunc",
                     "Select aggregation function for table",
-                    choices=["sum", "mean"],
+                    choices=list(PIVOT_AGGFUNCS),
                     selected="sum",
                 ),
                 ui.output_data_frame("pivot_table_data")
 
             )
         ),
+        build_workspace_ui(),
         class_="mt-3"
     )
 
-def app_ui(tbs, tracker):
+def build_workspace_ui():
+    """Build the reform workspace card: saved reforms compared side by side."""
+    return ui.card(
+        ui.card_header(
+            ui.h4("🗂️ Comparaison de réformes", class_="mb-0")
+        ),
+        ui.card_body(
+            ui.layout_columns(
+                ui.input_text("workspace_name", "Nom de la réforme", placeholder="Réforme A"),
+                ui.input_action_button("workspace_save", "Enregistrer l'état actuel", class_="btn-primary mt-4"),
+                col_widths=[8, 4]
+            ),
+            ui.input_selectize("workspace_selected", "Réformes", choices=[], multiple=True, width="100%"),
+            ui.div(
+                ui.input_action_button("workspace_compare", "Comparer", class_="btn-success me-2"),
+                ui.input_action_button("workspace_load", "Charger dans l'éditeur", class_="btn-outline-primary me-2"),
+                ui.input_action_button("workspace_remove", "Supprimer", class_="btn-outline-danger"),
+                class_="mb-3"
+            ),
+            ui.output_text("workspace_status"),
+            ui.output_data_frame("workspace_aggregates"),
+            ui.hr(),
+            ui.layout_columns(
+                ui.input_select("workspace_pivot_variable", "Variable", choices=list(PIVOT_VARIABLES)),
+                ui.input_select("workspace_pivot_aggfunc", "Agrégation", choices=list(PIVOT_AGGFUNCS)),
+                col_widths=[6, 6]
+            ),
+            ui.output_data_frame("workspace_pivot")
+        ),
+        class_="mt-3"
+    )
+
+def build_sweep_ui():
+    """Build the parameter sweep section UI."""
+    return ui.div(
+        ui.card(
+            ui.card_header(
+                ui.h4("📈 Parameter Sweep", class_="mb-0")
+            ),
+            ui.card_body(
+                ui.p("Evaluate a range of values of one displayed parameter, on top of the other changes.",
+                     class_="text-muted mb-3"),
+                ui.input_selectize(
+                    "sweep_field",
+                    "Parameter to sweep",
+                    choices=[],
+                ),
+                ui.layout_columns(
+                    ui.input_numeric("sweep_start", "From", value=0),
+                    ui.input_numeric("sweep_stop", "To", value=1),
+                    ui.input_numeric("sweep_steps", "Points", value=20, min=2, max=200),
+                    col_widths=[4, 4, 4]
+                ),
+                ui.input_action_button(
+                    "sweep_btn",
+                    "Run Sweep",
+                    class_="btn-primary mb-3"
+                ),
+                ui.output_text("sweep_status"),
+                output_widget("sweep_plot")
+            )
+        ),
+        class_="mt-3"
+    )
+
+def build_projection_ui(period: int):
+    """Build the multi-year projection section UI."""
+    return ui.div(
+        ui.card(
+            ui.card_header(
+                ui.h4("🗓️ Projection pluriannuelle", class_="mb-0")
+            ),
+            ui.card_body(
+                ui.p("Les modifications s'appliquent à partir du 1er janvier de l'année de début.",
+                     class_="text-muted mb-3"),
+                ui.layout_columns(
+                    ui.input_numeric("projection_start", "Année de début", value=period, step=1),
+                    ui.input_numeric("projection_end", "Année de fin", value=period + 4, step=1),
+                    col_widths=[6, 6]
+                ),
+                ui.input_action_button("projection_btn", "Lancer la projection", class_="btn-primary"),
+                ui.output_text("projection_status"),
+                output_widget("projection_plot"),
+                ui.output_data_frame("projection_table")
+            )
+        ),
+        class_="mt-3"
+    )
+
+def build_diagnostics_ui():
+    """Build the diagnostics section UI: timings of the session and of the process."""
+    return ui.div(
+        ui.card(
+            ui.card_header(ui.h4("⏱️ Session", class_="mb-0")),
+            ui.card_body(ui.output_data_frame("diagnostics_session"))
+        ),
+        ui.card(
+            ui.card_header(ui.h4("⏱️ Processus", class_="mb-0")),
+            ui.card_body(ui.output_data_frame("diagnostics_process")),
+            class_="mt-3"
+        ),
+        ui.card(
+            ui.card_header(ui.h4("💾 Mémoire", class_="mb-0")),
+            ui.card_body(ui.output_text_verbatim("diagnostics_memory")),
+            class_="mt-3"
+        ),
+        class_="container-fluid"
+    )
+
+def app_ui(index: ParameterIndex, lazy: bool = False, period: int = 2023):
     """
     Main application UI with improved change detection.
 
     Args:
-        tbs: Tax benefit system
-        tracker: Parameter change tracker
+        index: Parameter index shared by all sessions
+        lazy: Only render the top-level accordion, panels being built on first opening
+        period: Default first year of the projections
 
     Returns:
         UI layout
     """
-    param_root = tbs.parameters
-
-    # Clear any existing tracked changes before building UI
-    # This is crucial to prevent false positives
-    if hasattr(tracker, 'clear_all_changes'):
-        tracker.clear_all_changes()
-
     return ui.page_navbar(
         # Reform Panel
         ui.nav_panel(
@@ -229,8 +412,18 @@ def app_ui(tbs, tracker):
                         ui.h3("⚙️ Parameters", class_="mb-0")
                     ),
                     ui.card_body(
+                        ui.input_text(
+                            "param_search",
+                            None,
+                            placeholder="🔍 Rechercher un paramètre (chemin, description)...",
+                            width="100%"
+                        ),
+                        ui.div(
+                            ui.output_ui("param_search_results"),
+                            style="max-height: 400px; overflow-y: auto;"
+                        ),
                         ui.div(
-                            *build_param_ui(param_root, tracker=tracker),
+                            *(build_lazy_param_ui(index) if lazy else build_param_ui(index)),
                             style="max-height: 600px; overflow-y: auto;"
                         )
                     ),
@@ -308,6 +501,30 @@ def app_ui(tbs, tracker):
             build_results_ui()
         ),
 
+        # Sweep Panel
+        ui.nav_panel(
+            "📈 Sweep",
+            build_sweep_ui()
+        ),
+
+        # Projection Panel
+        ui.nav_panel(
+            "🗓️ Projection",
+            build_projection_ui(period)
+        ),
+
+        # Diagnostics Panel (hidden unless `?diagnostics` is in the URL)
+        ui.nav_panel(
+            "🩺 Diagnostics",
+            build_diagnostics_ui(),
+            value="diagnostics"
+        ),
+
+        header=ui.TagList(
+            _script("www/reset_inputs.js"),
+            _script("plotly/plotly.min.js"),
+            _script("www/figures.js")
+        ),
         title="Tax Reform Tool",
         id="main_navbar"
     )
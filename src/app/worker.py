@@ -0,0 +1,221 @@
+'''Simulation Pool Module.
+
+This module runs the reform simulations on a pool of worker processes, so
+that one analyst's reform does not block the Shiny event loop of the other
+sessions. Identical jobs are coalesced and finished results are kept in the
+shared cache.
+
+The `simulation` module, and with it the survey data package, is only
+imported in the worker processes. Each worker computes its own baseline:
+OpenFisca simulations are graphs of Python objects that cannot be shared
+between processes, so the baseline is duplicated once per worker in
+exchange for reforms running in parallel. Fewer workers
+(`REFORM_SIMULATION_WORKERS`) mean less memory and a faster warm-up.'''
+
+import asyncio
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cache import ScenarioCache
+from preview import PreviewResults
+from reform import reform_fingerprint
+from results import ReformResults
+from store import ResultStore
+
+
+def _warm_worker(periods: Iterable[int], max_baseline_periods: int):
+    import simulation
+    simulation.baseline_store.max_periods = max_baseline_periods
+    simulation.warm_baseline(periods)
+
+
+def _run_job(changes: Optional[Dict[str, str]], period: int, start: Optional[str] = None,
+             progress=None) -> ReformResults:
+    import simulation
+    return simulation.run_reform(changes, period, start=start, progress=progress)
+
+
+def _run_preview_job(changes: Dict[str, str], period: int, sample_size: int) -> PreviewResults:
+    import simulation
+    return simulation.run_preview(changes, period, sample_size)
+
+
+class SimulationPool:
+    def __init__(self, max_workers: Optional[int] = None, cache: Optional[ScenarioCache] = None,
+                 baseline_periods: Iterable[int] = (), store: Optional[ResultStore] = None,
+                 max_baseline_periods: int = 2):
+        self.max_workers = max_workers
+        self.cache = cache if cache is not None else ScenarioCache(max_bytes=0)
+        # Results persisted on disk, shared across restarts and workers
+        self.store = store
+        # Periods whose baseline each worker computes as soon as it starts
+        self.baseline_periods = tuple(baseline_periods)
+        # Other periods whose baseline each worker keeps, least recently used out
+        self.max_baseline_periods = max_baseline_periods
+        self._executor = None
+        self._manager = None
+        # Jobs in flight and number of sessions waiting for each of them
+        self._running: Dict[Tuple[str, int], Future] = {}
+        self._waiters: Dict[Tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+        # Guards the executor only: it is replaced while `_lock` may be held
+        self._executor_lock = threading.Lock()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_warm_worker,
+                    initargs=(self.baseline_periods, self.max_baseline_periods)
+                )
+            return self._executor
+
+    def _submit_job(self, function, *args) -> Future:
+        """
+        Submit a job to the executor, rebuilt if a dead worker or a failed
+        initializer broke it.
+        """
+        try:
+            executor = self.executor
+            future = executor.submit(function, *args)
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            executor = self.executor
+            future = executor.submit(function, *args)
+        future.add_done_callback(lambda done: self._check_broken(executor, done))
+        return future
+
+    def _check_broken(self, executor: ProcessPoolExecutor, future: Future):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            # This job fails, the next ones get a new executor
+            self._discard_executor(executor)
+
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        with self._executor_lock:
+            if self._executor is not executor:
+                # Already replaced after another job of the broken executor
+                return
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def progress_queue(self):
+        """Queue the workers can stream the progress of a job on"""
+        with self._lock:
+            if self._manager is None:
+                self._manager = multiprocessing.get_context("spawn").Manager()
+        return self._manager.Queue()
+
+    @staticmethod
+    def drain(progress) -> list:
+        """Messages put on a progress queue since the last call, without waiting"""
+        messages = []
+        while True:
+            try:
+                messages.append(progress.get_nowait())
+            except queue.Empty:
+                return messages
+
+    @staticmethod
+    def job_key(changes: Optional[Dict[str, str]], period: int, start: Optional[str] = None) -> Tuple[str, int]:
+        return (reform_fingerprint(changes, period, start) if changes else "baseline", period)
+
+    def submit(self, changes: Optional[Dict[str, str]], period: int, start: Optional[str] = None,
+               progress=None) -> Future:
+        """
+        Submit the simulation of a reform, reusing a cached or stored result, or a job in flight.
+
+        Only a newly started job streams its progress on the `progress` queue.
+        """
+        key = self.job_key(changes, period, start)
+        with self._lock:
+            cached = self.cache.get(key)
+            if cached is None and self.store is not None:
+                cached = self.store.load(*key)
+                if cached is not None:
+                    self.cache.put(key, cached)
+            if cached is not None:
+                future = Future()
+                future.set_result(cached)
+                return future
+
+            if key not in self._running:
+                future = self._submit_job(_run_job, changes, period, start, progress)
+                self._running[key] = future
+                future.add_done_callback(lambda done: self._job_done(key, done))
+            return self._running[key]
+
+    def _job_done(self, key: Tuple[str, int], future: Future):
+        with self._lock:
+            self._running.pop(key, None)
+            self._waiters.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            self.cache.put(key, future.result())
+            if self.store is not None:
+                self.store.save(future.result())
+
+    def warm_baseline(self, period: int) -> Future:
+        """Simulate the baseline of a period ahead of time and keep it in the cache"""
+        self.cache.pin(self.job_key(None, period))
+        return self.submit(None, period)
+
+    async def run(self, changes: Optional[Dict[str, str]], period: int, start: Optional[str] = None,
+                  progress=None) -> ReformResults:
+        """
+        Await the results of a reform.
+
+        Cancelling the caller only cancels the job if no other session waits for it,
+        and only if it has not started: worker processes cannot be interrupted, so a
+        running job completes and its result is cached.
+        """
+        key = self.job_key(changes, period, start)
+        future = self.submit(changes, period, start, progress)
+        with self._lock:
+            self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            with self._lock:
+                self._waiters[key] = self._waiters.get(key, 1) - 1
+                superseded = self._waiters[key] <= 0
+            if superseded:
+                future.cancel()
+            raise
+        finally:
+            if future.done():
+                with self._lock:
+                    self._waiters.pop(key, None)
+
+    async def run_preview(self, changes: Dict[str, str], period: int, sample_size: int) -> PreviewResults:
+        """Await approximate results of a reform on a subsample; previews are neither cached nor shared"""
+        future = self._submit_job(_run_preview_job, changes, period, sample_size)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+    async def run_many(self, jobs: Iterable[Optional[Dict[str, str]]], period: int) -> List[ReformResults]:
+        """Await a batch of reforms, simulated in parallel on the pool"""
+        return list(await asyncio.gather(*(self.run(changes, period) for changes in jobs)))
+
+    async def run_periods(self, changes: Optional[Dict[str, str]], periods: Iterable[int],
+                          start: Optional[str] = None) -> Dict[int, ReformResults]:
+        """Await a reform applied from `start` on, simulated for each period in parallel on the pool"""
+        periods = list(periods)
+        results = await asyncio.gather(*(self.run(changes, period, start) for period in periods))
+        return dict(zip(periods, results))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
@@ -0,0 +1,138 @@
+'''Reform Workspace Module.
+
+This module keeps the tracker states a session saved as named reforms, and
+evaluates them together. The reforms run in parallel on the simulation
+pool, whose workers share one baseline per period, so N reforms cost one
+baseline plus N reform branches. Their aggregates and pivots are shown as
+aligned columns, one per reform.'''
+
+from typing import Dict
+
+import pandas as pd
+from shiny import reactive, render, ui
+
+from parameter import SimpleParameterTracker
+from results import PIVOT_GROUP_VARIABLE, ReformResults
+from search import SEARCH_PREFIX
+from worker import SimulationPool
+
+MEASURES = {"amount": "montant", "beneficiaries": "bénéficiaires"}
+
+
+def compare_aggregates(results_by_name: Dict[str, ReformResults]) -> pd.DataFrame:
+    """Baseline aggregates, then the reform value and difference of each reform"""
+    if not results_by_name:
+        return pd.DataFrame()
+    first = next(iter(results_by_name.values()))
+    columns = {
+        "variable": first.aggregates["label"],
+        **{f"référence · {label}": first.aggregates[f"baseline_{measure}"] for measure, label in MEASURES.items()},
+    }
+    for name, results in results_by_name.items():
+        for measure, label in MEASURES.items():
+            simulation = "reform" if results.has_reform else "baseline"
+            columns[f"{name} · {label}"] = results.aggregates[f"{simulation}_{measure}"]
+            columns[f"{name} · Δ {label}"] = results.aggregates.get(f"absolute_difference_{measure}", 0.0)
+    return pd.DataFrame(columns)
+
+
+def compare_pivots(results_by_name: Dict[str, ReformResults], variable: str, aggfunc: str) -> pd.DataFrame:
+    """Reform - baseline pivot of `variable` by parts fiscales, one column per reform"""
+    columns = {}
+    for name, results in results_by_name.items():
+        table = results.pivot_table(variable, aggfunc)[variable]
+        # A reform without edits is simulated as the baseline: its difference is zero
+        columns[name] = table if results.has_reform else table * 0
+    return pd.concat(columns, axis=1).rename_axis(PIVOT_GROUP_VARIABLE).fillna(0)
+
+
+class ReformWorkspace:
+    def __init__(self, tracker: SimpleParameterTracker, period: int, pool: SimulationPool):
+        self.tracker = tracker
+        self.period = period
+        self.pool = pool
+        # Edited values (field id -> text) of each saved reform
+        self.reforms: Dict[str, Dict[str, str]] = {}
+
+    def changes(self, name: str) -> Dict[str, str]:
+        """Changes (path -> value) of a saved reform, as simulated"""
+        return {self.tracker.index[field_id].path: value for field_id, value in sorted(self.reforms[name].items())}
+
+    def register_outputs(self, input, output, session, changes_version):
+        reforms_version = reactive.value(0)
+
+        def bump_reforms():
+            with reactive.isolate():
+                reforms_version.set(reforms_version.get() + 1)
+
+        @reactive.extended_task
+        async def compare(jobs, period):
+            results = await self.pool.run_many(jobs.values(), period)
+            return dict(zip(jobs, results))
+
+        @reactive.effect
+        @reactive.event(input.workspace_save)
+        def _save():
+            name = (input.workspace_name() or "").strip() or f"Réforme {len(self.reforms) + 1}"
+            self.reforms[name] = self.tracker.current_values
+            bump_reforms()
+            ui.update_text("workspace_name", value="")
+
+        @reactive.effect
+        @reactive.event(input.workspace_remove)
+        def _remove():
+            for name in input.workspace_selected() or ():
+                self.reforms.pop(name, None)
+            bump_reforms()
+
+        @reactive.effect
+        @reactive.event(input.workspace_load)
+        async def _load():
+            selected = input.workspace_selected() or ()
+            if len(selected) != 1 or selected[0] not in self.reforms:
+                return
+            # The inputs are set in one message, like the resets
+            values = self.tracker.reset_changes()
+            for field_id, value in self.reforms[selected[0]].items():
+                self.tracker.update_value(field_id, value)
+                values[field_id] = value
+            await session.send_custom_message("reset_inputs", {"values": values, "prefixes": ["", SEARCH_PREFIX]})
+            with reactive.isolate():
+                changes_version.set(changes_version.get() + 1)
+
+        @reactive.effect
+        def _update_choices():
+            reforms_version()
+            ui.update_selectize("workspace_selected", choices=list(self.reforms), selected=list(self.reforms))
+
+        @reactive.effect
+        @reactive.event(input.workspace_compare)
+        def _compare():
+            names = [name for name in input.workspace_selected() or () if name in self.reforms]
+            if not names:
+                return
+            if compare.status() == "running":
+                compare.cancel()
+            compare.invoke({name: self.changes(name) for name in names}, self.period)
+
+        @output
+        @render.text
+        def workspace_status():
+            reforms_version()
+            status = compare.status()
+            if status == "running":
+                return "⏳ Évaluation des réformes en cours..."
+            if status == "error":
+                return f"❌ Erreur lors de l'évaluation: {compare.error.get()}"
+            return f"{len(self.reforms)} réforme(s) enregistrée(s)"
+
+        @output
+        @render.data_frame
+        def workspace_aggregates():
+            return render.DataTable(compare_aggregates(compare.result()), width="100%")
+
+        @output
+        @render.data_frame
+        def workspace_pivot():
+            df = compare_pivots(compare.result(), input.workspace_pivot_variable(), input.workspace_pivot_aggfunc())
+            return render.DataTable(df.reset_index(), width="100%")
@@ -0,0 +1,52 @@
+// Draws the figures sent by the server ({id, figure}), whose numeric arrays
+// are base64 typed arrays ({dtype, bdata}), or shows their error ({id, error}).
+const FIGURE_TYPED_ARRAYS = {
+  f8: Float64Array, f4: Float32Array, i4: Int32Array, u4: Uint32Array,
+  i2: Int16Array, u2: Uint16Array, i1: Int8Array, u1: Uint8Array,
+};
+
+function decodeFigure(value) {
+  if (Array.isArray(value)) {
+    return value.map(decodeFigure);
+  }
+  if (value && typeof value === "object") {
+    if (typeof value.bdata === "string" && value.dtype in FIGURE_TYPED_ARRAYS) {
+      const bytes = Uint8Array.from(atob(value.bdata), (character) => character.charCodeAt(0));
+      return new FIGURE_TYPED_ARRAYS[value.dtype](bytes.buffer);
+    }
+    for (const key of Object.keys(value)) {
+      value[key] = decodeFigure(value[key]);
+    }
+  }
+  return value;
+}
+
+Shiny.addCustomMessageHandler("render_figure", function (message) {
+  const element = document.getElementById(message.id);
+  if (!element) {
+    return;
+  }
+  if (message.error !== undefined) {
+    Plotly.purge(element);
+    const error = document.createElement("p");
+    error.className = "text-danger";
+    error.textContent = "❌ " + message.error;
+    element.replaceChildren(error);
+    element.dataset.error = "true";
+    return;
+  }
+  if (element.dataset.error) {
+    // Drops the error shown in place of the figure
+    delete element.dataset.error;
+    element.replaceChildren();
+  }
+  const figure = decodeFigure(message.figure);
+  Plotly.react(element, figure.data, figure.layout, {responsive: true});
+});
+
+// Figures drawn in a hidden tab get their size when the tab is shown
+document.addEventListener("shown.bs.tab", function () {
+  for (const element of document.querySelectorAll(".reform-figure.js-plotly-plot")) {
+    Plotly.Plots.resize(element);
+  }
+});
@@ -0,0 +1,15 @@
+// Resets a batch of parameter inputs sent in a single message by the server
+// ({values: {field_id: initial value}, prefixes: ["", "search_"]}), instead
+// of one `update_text` message per field.
+Shiny.addCustomMessageHandler("reset_inputs", function (message) {
+  for (const [fieldId, value] of Object.entries(message.values)) {
+    for (const prefix of message.prefixes) {
+      const element = document.getElementById(prefix + fieldId);
+      if (element) {
+        element.value = value;
+        // Keeps the server-side value in sync; these updates are sent in one batch
+        Shiny.setInputValue(prefix + fieldId, value);
+      }
+    }
+  }
+});
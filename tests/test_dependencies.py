@@ -0,0 +1,99 @@
+"""Dependency graph of a small tax and benefit system, traced like the baseline"""
+
+import os
+import sys
+
+import pytest
+from openfisca_core.entities import build_entity
+from openfisca_core.parameters import ParameterNode
+from openfisca_core.simulations import SimulationBuilder
+from openfisca_core.taxbenefitsystems import TaxBenefitSystem
+from openfisca_core.variables import Variable
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "app"))
+
+from dependencies import DependencyGraph  # noqa: E402
+
+Person = build_entity(key="person", plural="persons", label="Person", is_person=True)
+Household = build_entity(
+    key="household", plural="households", label="Household",
+    roles=[{"key": "member", "plural": "members", "label": "Member"}]
+)
+
+
+class salaire(Variable):
+    value_type = float
+    entity = Person
+    definition_period = "year"
+    label = "Salaire"
+
+
+class impot(Variable):
+    value_type = float
+    entity = Person
+    definition_period = "year"
+    label = "Impôt, calculé par un barème"
+
+    def formula(person, period, parameters):
+        return parameters(period).impot.bareme.calc(person("salaire", period))
+
+
+class allocation(Variable):
+    value_type = float
+    entity = Person
+    definition_period = "year"
+    label = "Allocation, proportionnelle au salaire"
+
+    def formula(person, period, parameters):
+        return person("salaire", period) * parameters(period).prestations.taux
+
+
+class allocation_menage(Variable):
+    value_type = float
+    entity = Household
+    definition_period = "year"
+    label = "Allocations du ménage"
+
+    def formula(household, period, parameters):
+        return household.sum(household.members("allocation", period))
+
+
+PARAMETERS = {
+    "impot": {
+        "bareme": {
+            "brackets": [
+                {"threshold": {"2020-01-01": 0}, "rate": {"2020-01-01": 0}},
+                {"threshold": {"2020-01-01": 1000}, "rate": {"2020-01-01": 0.2}},
+            ]
+        }
+    },
+    "prestations": {"taux": {"values": {"2020-01-01": 0.1}}},
+}
+
+
+@pytest.fixture(scope="module")
+def graph() -> DependencyGraph:
+    tax_benefit_system = TaxBenefitSystem([Person, Household])
+    tax_benefit_system.add_variables(salaire, impot, allocation, allocation_menage)
+    tax_benefit_system.parameters = ParameterNode("", data=PARAMETERS)
+
+    simulation = SimulationBuilder().build_from_entities(tax_benefit_system, {
+        "persons": {"a": {"salaire": {"2020": 500}}, "b": {"salaire": {"2020": 3000}}},
+        "households": {"h": {"members": ["a", "b"]}},
+    })
+    simulation.trace = True
+    for variable in ("impot", "allocation_menage"):
+        simulation.calculate(variable, "2020")
+    return DependencyGraph.from_tracer(simulation.tracer)
+
+
+def test_plain_parameter_affects_its_readers_only(graph):
+    assert graph.is_traced("prestations.taux")
+    assert graph.affected_variables(["prestations.taux.2020_01_01"]) == {"allocation", "allocation_menage"}
+
+
+def test_untraced_scale_affects_every_variable(graph):
+    # Reading a scale leaves no trace: a bracket edit must not reuse any baseline value
+    assert not graph.is_traced("impot.bareme")
+    affected = graph.affected_variables(["impot.bareme.brackets[1].rate.2020_01_01"])
+    assert {"impot", "allocation", "allocation_menage"} <= affected